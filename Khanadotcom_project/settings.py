@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 from pathlib import Path
 import os
 from dotenv import load_dotenv
+from django.core.exceptions import ImproperlyConfigured
 
 load_dotenv()
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -61,6 +62,7 @@ AUTH_USER_MODEL = "khanadotcom_app.User"
 MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "khanadotcom_app.middleware.CompressionMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -90,6 +92,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "khanadotcom_project.wsgi.application"
+ASGI_APPLICATION = "khanadotcom_project.asgi.application"
 
 
 # Database
@@ -107,6 +110,30 @@ DATABASES = {
         "OPTIONS": {"init_command": "SET sql_mode='STRICT_TRANS_TABLES'"},
     },
 }
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.getenv("CACHE_LOCATION", "khanadotcom"),
+    },
+}
+# Catalog, search and user versions, login throttling and idempotency keys
+# must be seen by every worker process, which a per-process cache is not.
+if CACHES["default"]["BACKEND"].endswith(".LocMemCache") and not DEBUG:
+    raise ImproperlyConfigured(
+        "CACHE_BACKEND must be a cache shared by all processes, e.g. "
+        "django.core.cache.backends.redis.RedisCache, when DEBUG is off."
+    )
+if CACHES["default"]["BACKEND"].endswith(
+    (".LocMemCache", ".FileBasedCache", ".DatabaseCache")
+):
+    # These cull a third of their keys once MAX_ENTRIES (300 by default) is
+    # reached, and an evicted version key would serve stale entries.
+    CACHES["default"]["OPTIONS"] = {
+        "MAX_ENTRIES": int(os.getenv("CACHE_MAX_ENTRIES", 100000))
+    }
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -153,9 +180,78 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "khanadotcom_app.authentication.CachedJWTAuthentication",
     ),
 }
+
+# Authenticated users and verified tokens kept per process, see
+# khanadotcom_app/authentication.py. Tokens are kept until they expire.
+AUTH_USER_CACHE_SIZE = int(os.getenv("AUTH_USER_CACHE_SIZE", 10000))
+AUTH_USER_CACHE_TTL = int(os.getenv("AUTH_USER_CACHE_TTL", 300))
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", 10000))
+
+# Failed logins allowed per email and per client IP within a sliding window
+# (seconds) before further attempts are refused.
+LOGIN_THROTTLE_WINDOW = int(os.getenv("LOGIN_THROTTLE_WINDOW", 15 * 60))
+LOGIN_THROTTLE_EMAIL_LIMIT = int(os.getenv("LOGIN_THROTTLE_EMAIL_LIMIT", 10))
+LOGIN_THROTTLE_IP_LIMIT = int(os.getenv("LOGIN_THROTTLE_IP_LIMIT", 100))
+# Reverse proxies in front of the app that append to X-Forwarded-For. With
+# none, the client IP is REMOTE_ADDR and the header is ignored.
+LOGIN_TRUSTED_PROXIES = int(os.getenv("LOGIN_TRUSTED_PROXIES", 0))
+
+# Email outbox drained by `manage.py send_outbox`. Claimed rows are held for
+# OUTBOX_CLAIM_SECONDS; failed sends are retried after 1, 2, 4... times
+# OUTBOX_RETRY_BASE_SECONDS, up to OUTBOX_MAX_ATTEMPTS tries.
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 100))
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", 4))
+OUTBOX_CLAIM_SECONDS = int(os.getenv("OUTBOX_CLAIM_SECONDS", 300))
+OUTBOX_RETRY_BASE_SECONDS = int(os.getenv("OUTBOX_RETRY_BASE_SECONDS", 30))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 5))
+
+# Keyset pagination for the catalog listings
+CATALOG_PAGE_SIZE = int(os.getenv("CATALOG_PAGE_SIZE", 50))
+CATALOG_MAX_PAGE_SIZE = int(os.getenv("CATALOG_MAX_PAGE_SIZE", 200))
+ORDER_HISTORY_PAGE_SIZE = int(os.getenv("ORDER_HISTORY_PAGE_SIZE", 20))
+
+# Catalog response cache (seconds). Entries are invalidated by version bumps
+# on every write, the timeout only bounds how long unused entries linger.
+CATALOG_CACHE_TIMEOUT = int(os.getenv("CATALOG_CACHE_TIMEOUT", 300))
+CATALOG_CACHE_STALE_GRACE = int(os.getenv("CATALOG_CACHE_STALE_GRACE", 60))
+
+# How long (seconds) a response is replayed for retries with the same
+# Idempotency-Key
+IDEMPOTENCY_KEY_TTL = int(os.getenv("IDEMPOTENCY_KEY_TTL", 24 * 60 * 60))
+
+# JSON bodies under this many bytes are sent uncompressed
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", 512))
+
+# Longest wait (seconds) a restaurant order queue long-poll may ask for
+ORDER_QUEUE_MAX_WAIT = float(os.getenv("ORDER_QUEUE_MAX_WAIT", 25))
+
+# Order status lookups are cached this long (seconds). Status changes write
+# through, so the timeout only bounds staleness after out-of-band updates.
+ORDER_STATUS_CACHE_TTL = int(os.getenv("ORDER_STATUS_CACHE_TTL", 30))
+
+# Live order status streams (/order/<id>/events/). The hub is
+# khanadotcom_app.events.InProcessHub for a single process, or
+# khanadotcom_app.events.CacheHub to fan out through a shared cache.
+ORDER_EVENTS_HUB = os.getenv("ORDER_EVENTS_HUB", "khanadotcom_app.events.InProcessHub")
+ORDER_EVENTS_HEARTBEAT = float(os.getenv("ORDER_EVENTS_HEARTBEAT", 15))
+ORDER_EVENTS_MAX_SECONDS = float(os.getenv("ORDER_EVENTS_MAX_SECONDS", 300))
+ORDER_EVENTS_RETRY_MS = int(os.getenv("ORDER_EVENTS_RETRY_MS", 3000))
+ORDER_EVENTS_POLL_INTERVAL = float(os.getenv("ORDER_EVENTS_POLL_INTERVAL", 0.5))
+
+# Batch dispatch cost: km of pickup distance, minus this many km per star of
+# driver rating. Orders or drivers without coordinates count as this far.
+# A pass weighs its orders against at most DISPATCH_MAX_DRIVERS free drivers.
+DISPATCH_RATING_WEIGHT_KM = float(os.getenv("DISPATCH_RATING_WEIGHT_KM", 0.5))
+DISPATCH_UNKNOWN_DISTANCE_KM = float(os.getenv("DISPATCH_UNKNOWN_DISTANCE_KM", 50))
+DISPATCH_MAX_DRIVERS = int(os.getenv("DISPATCH_MAX_DRIVERS", 2000))
+
+# Nearby restaurant search radius (km)
+NEARBY_DEFAULT_RADIUS_KM = float(os.getenv("NEARBY_DEFAULT_RADIUS_KM", 5))
+NEARBY_MAX_RADIUS_KM = float(os.getenv("NEARBY_MAX_RADIUS_KM", 50))
+
 from datetime import timedelta
 
 SIMPLE_JWT = {
@@ -3,8 +3,11 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from khanadotcom_app.public import public_routes
 
-urlpatterns = [
-    path("admin/", admin.site.urls),
-    path("", include("khanadotcom_app.urls")),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+
+urlpatterns = (
+    public_routes(path("admin/", admin.site.urls))
+    + [path("", include("khanadotcom_app.urls"))]
+    + public_routes(*static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT))
+)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class KhanadotcomAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'khanadotcom_app'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,174 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from . import catalog_cache
+from .metrics import metrics, ratio
+
+# JWT authentication without a user query or signature check per request.
+#
+# Authenticated users are kept in a per-process LRU, each entry tagged with
+# the user's version from the shared cache (the "user:<id>" scope of
+# catalog_cache). Any save or delete of the user row bumps that version (see
+# signals.py), so a profile update, password change or soft delete is seen
+# by every process on its next request, and entries also expire after
+# AUTH_USER_CACHE_TTL seconds to bound writes that skip the signals.
+#
+# Verified tokens are kept in a second LRU, keyed by a SHA-256 of the raw
+# token, until their ``exp``. A client re-sending the same token pays a hash
+# lookup instead of a signature check. Within a request the token is checked
+# once: TokenMiddleware stores the result on the request, and DRF picks it up
+# from there instead of authenticating again.
+
+
+def user_scope(user_id):
+    return f"user:{user_id}"
+
+
+class UserCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # user_id -> (version, expires, user)
+
+    def get(self, user_id, version):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            entry_version, expires, user = entry
+            if entry_version != version or expires < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+        # Views change and save request.user; each request gets its own copy.
+        return copy.copy(user)
+
+    def put(self, user_id, version, user):
+        expires = time.monotonic() + settings.AUTH_USER_CACHE_TTL
+        with self._lock:
+            self._entries[user_id] = (version, expires, copy.copy(user))
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > settings.AUTH_USER_CACHE_SIZE:
+                self._entries.popitem(last=False)
+
+    def discard(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache()
+
+
+class TokenCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # token digest -> (exp, validated token)
+
+    def get(self, digest):
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            exp, token = entry
+            if exp <= time.time():
+                del self._entries[digest]
+                return None
+            self._entries.move_to_end(digest)
+            return token
+
+    def put(self, digest, token):
+        exp = token.get("exp")
+        if exp is None:
+            return
+        with self._lock:
+            self._entries[digest] = (exp, token)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > settings.AUTH_TOKEN_CACHE_SIZE:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache()
+
+
+def user_changed(user_id):
+    # Bump now, so nothing is served from before the write, and again on
+    # commit, so a reload of the old row in between does not stick either.
+    scope = user_scope(user_id)
+    catalog_cache.bump(scope)
+    user_cache.discard(user_id)
+    transaction.on_commit(lambda: catalog_cache.bump(scope))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def authenticate(self, request):
+        # DRF wraps the request TokenMiddleware already authenticated.
+        http_request = getattr(request, "_request", request)
+        user = getattr(http_request, "UserData", None)
+        if user is not None:
+            metrics.incr("auth.request_reuses")
+            return user, http_request.token
+        return super().authenticate(request)
+
+    def get_validated_token(self, raw_token):
+        digest = hashlib.sha256(raw_token).hexdigest()
+        token = token_cache.get(digest)
+        if token is not None:
+            metrics.incr("auth.token_cache.hits")
+            return token
+        metrics.incr("auth.token_cache.misses")
+        token = super().get_validated_token(raw_token)
+        token_cache.put(digest, token)
+        return token
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if user_id is None:
+            return super().get_user(validated_token)
+        version = catalog_cache.scope_version(user_scope(user_id))
+        user = user_cache.get(user_id, version)
+        if user is None:
+            metrics.incr("auth.user_cache.misses")
+            user = super().get_user(validated_token)
+            user_cache.put(user_id, version, user)
+            return user
+
+        metrics.incr("auth.user_cache.hits")
+        # Only active users are cached; the revocation claim is per token.
+        if api_settings.CHECK_REVOKE_TOKEN and validated_token.get(
+            api_settings.REVOKE_TOKEN_CLAIM
+        ) != get_md5_hash_password(user.password):
+            raise AuthenticationFailed(
+                "The user's password has been changed.", code="password_changed"
+            )
+        return user
+
+
+def report():
+    # Hit rates of both caches, for the metrics endpoint.
+    summary = {"request_reuses": int(metrics.get("auth.request_reuses"))}
+    for name in ("user_cache", "token_cache"):
+        hits = metrics.get(f"auth.{name}.hits")
+        misses = metrics.get(f"auth.{name}.misses")
+        summary[name] = {
+            "hits": int(hits),
+            "misses": int(misses),
+            "hit_rate": ratio(hits, hits + misses),
+        }
+    return summary
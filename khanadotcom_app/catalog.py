@@ -0,0 +1,138 @@
+import hashlib
+
+from rest_framework.renderers import JSONRenderer
+
+from . import catalog_cache
+from .conditional import Validators, make_etag
+from .models import MenuItem, Restaurant
+
+# Response fields of a menu item and the column each one is read from. The
+# restaurant name comes from the same joined SELECT, so listing N items
+# costs one query instead of N + 1.
+MENU_ITEM_FIELDS = {
+    "id": "menu_item_id",
+    "name": "name",
+    "restaurant": "restaurant__name",
+    "restaurant_id": "restaurant_id",
+    "price": "price",
+    "description": "description",
+    "image": "menu_item_pic",
+    "availability": "availability",
+    "rating": "rating",
+    "preparation_time": "preparation_time",
+}
+
+RESTAURANT_FIELDS = {
+    "id": "restaurant_id",
+    "name": "name",
+    "image": "profile_pic",
+    "rating": "rating",
+    "description": "description",
+}
+
+RESTAURANT_DETAIL_FIELDS = {
+    "id": "restaurant_id",
+    "name": "name",
+    "rating": "rating",
+    "description": "description",
+    "image": "profile_pic",
+    "address": "address",
+    "phone_number": "phone_number",
+    "email": "email",
+    "restaurant_GST": "restaurant_GST",
+}
+
+MENU_ITEM_COLUMNS = tuple(MENU_ITEM_FIELDS.values())
+RESTAURANT_LIST_COLUMNS = tuple(RESTAURANT_FIELDS.values())
+
+MENU_ITEM_IMAGE = MenuItem._meta.get_field("menu_item_pic")
+RESTAURANT_IMAGE = Restaurant._meta.get_field("profile_pic")
+
+
+def media_url(field, name):
+    # Build the public url of a stored file from its raw column value,
+    # without instantiating the model the FileField belongs to.
+    if not name:
+        return None
+    return field.storage.url(name)
+
+
+def columns_for(field_map, fields, extra=()):
+    # SELECT list for a sparse fieldset; ``extra`` carries columns the view
+    # needs itself, such as the keyset pagination ordering.
+    columns = [field_map[name] for name in fields]
+    return tuple(dict.fromkeys(columns + list(extra)))
+
+
+def _render(row, field_map, fields, image):
+    data = {}
+    for name in fields or field_map:
+        value = row[field_map[name]]
+        data[name] = media_url(image, value) if name == "image" else value
+    return data
+
+
+def menu_item_values(queryset, fields=MENU_ITEM_FIELDS, extra=()):
+    return queryset.values(*columns_for(MENU_ITEM_FIELDS, fields, extra))
+
+
+def serialize_menu_item(row, fields=None):
+    return _render(row, MENU_ITEM_FIELDS, fields, MENU_ITEM_IMAGE)
+
+
+def restaurant_values(queryset, fields=RESTAURANT_FIELDS, extra=()):
+    return queryset.values(*columns_for(RESTAURANT_FIELDS, fields, extra))
+
+
+def serialize_restaurant(row, fields=None):
+    return _render(row, RESTAURANT_FIELDS, fields, RESTAURANT_IMAGE)
+
+
+def serialize_restaurant_detail(row, fields=None):
+    return _render(row, RESTAURANT_DETAIL_FIELDS, fields, RESTAURANT_IMAGE)
+
+
+# Per-restaurant menu snapshots. The menu page is the hottest read, so the
+# JSON body is rendered once per menu change and stored as bytes in the
+# versioned catalog cache; requests hand those bytes straight back without
+# running the ORM or the renderer. Snapshots are rebuilt right after any
+# menu item (availability, rating, ...) or restaurant write commits, see
+# signals.py.
+
+
+class MenuSnapshot:
+    def __init__(self, body, validators):
+        self.body = body
+        self.validators = validators
+
+
+def build_menu_snapshot(restaurant_id):
+    rows = list(
+        MenuItem.objects.filter(restaurant_id=restaurant_id)
+        .values(*MENU_ITEM_COLUMNS, "updated_at", "restaurant__updated_at")
+        .order_by("menu_item_id")
+    )
+    body = JSONRenderer().render([serialize_menu_item(row) for row in rows])
+    stamps = [
+        stamp
+        for row in rows
+        for stamp in (row["updated_at"], row["restaurant__updated_at"])
+        if stamp is not None
+    ]
+    last = max(stamps) if stamps else None
+    return MenuSnapshot(
+        body,
+        Validators(
+            make_etag(hashlib.sha1(body).hexdigest()),
+            int(last.timestamp()) if last else None,
+        ),
+    )
+
+
+def menu_snapshot(restaurant_id):
+    return catalog_cache.read(
+        f"menu:{restaurant_id}",
+        None,
+        lambda: build_menu_snapshot(restaurant_id),
+        name="snapshot",
+    )
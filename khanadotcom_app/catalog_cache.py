@@ -0,0 +1,112 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Versioned response cache for the catalog reads.
+#
+# Every cache entry key embeds the current version of its scope
+# ("restaurants", "restaurant:<id>", "menu:<id>"). Writes never delete
+# entries, they bump the scope version (see signals.py) and the old entries
+# simply stop being addressed and age out. A read is a version lookup plus
+# one entry lookup and never touches the database while the entry is warm.
+#
+# Entries carry a soft expiry. Once it passes, one request takes a short
+# lock and rebuilds the entry while everyone else keeps serving the stale
+# copy, so a hot key expiring does not send every worker to MySQL at once.
+
+VERSION_KEY = "catalog:version:{}"
+ENTRY_KEY = "catalog:{}:{}:{}:{}"
+LOCK_SUFFIX = ":lock"
+LOCK_TIMEOUT = 10
+LOCK_WAIT = 0.05
+
+MISSING = object()
+
+
+def _initial_version():
+    # Seed versions from the clock so a counter that was evicted from the
+    # cache can never come back at a value older entries were stored under.
+    return int(time.time() * 1000)
+
+
+def scope_version(scope):
+    key = VERSION_KEY.format(scope)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump(*scopes):
+    versions = []
+    for scope in scopes:
+        key = VERSION_KEY.format(scope)
+        try:
+            versions.append(cache.incr(key))
+        except ValueError:
+            versions.append(_initial_version())
+            cache.set(key, versions[-1], None)
+    return versions
+
+
+def variant_key(params):
+    if not params:
+        return "-"
+    encoded = "&".join(
+        f"{name}={value}" for name in sorted(params) for value in params.getlist(name)
+    )
+    return hashlib.sha1(encoded.encode()).hexdigest()
+
+
+def _store(key, value):
+    timeout = settings.CATALOG_CACHE_TIMEOUT
+    cache.set(
+        key,
+        (value, time.time() + timeout),
+        timeout + settings.CATALOG_CACHE_STALE_GRACE,
+    )
+
+
+def _wait_for(key):
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_WAIT)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[0]
+        if cache.get(key + LOCK_SUFFIX) is None:
+            break
+    return MISSING
+
+
+def read(scope, params, build, name="body"):
+    key = ENTRY_KEY.format(scope, scope_version(scope), name, variant_key(params))
+    lock = key + LOCK_SUFFIX
+
+    entry = cache.get(key)
+    if entry is not None:
+        value, fresh_until = entry
+        if fresh_until > time.time():
+            return value
+        locked = cache.add(lock, 1, LOCK_TIMEOUT)
+        if not locked:
+            return value
+    else:
+        locked = cache.add(lock, 1, LOCK_TIMEOUT)
+        if not locked:
+            # Someone else is already building this entry, give them a
+            # moment instead of issuing the same queries in parallel.
+            value = _wait_for(key)
+            if value is not MISSING:
+                return value
+
+    try:
+        value = build()
+        _store(key, value)
+    finally:
+        if locked:
+            cache.delete(lock)
+    return value
@@ -0,0 +1,171 @@
+import gzip
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_vary_headers
+
+from .metrics import metrics, ratio
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Content-Encoding for the JSON API.
+#
+# Responses that carry an ETag (the catalog) are compressed once per ETag
+# and encoding and the compressed bytes are kept in the cache next to the
+# plain body, so a menu is compressed once per catalog change rather than
+# once per request. Those get the slow, tight compression levels; responses
+# without a validator are compressed on the fly with fast levels.
+
+COMPRESSED_KEY = "compressed:{}:{}"
+# Only responses under this path are compressed, see middleware.py.
+PATH_PREFIX = "/api/"
+
+# encoding -> (compress(body, level), on-the-fly level, precompressed level),
+# in order of preference when the client accepts several equally.
+CODECS = {}
+if zstandard is not None:
+    CODECS["zstd"] = (
+        lambda body, level: zstandard.ZstdCompressor(level=level).compress(body),
+        3,
+        12,
+    )
+if brotli is not None:
+    CODECS["br"] = (
+        lambda body, level: brotli.compress(body, quality=level),
+        4,
+        9,
+    )
+CODECS["gzip"] = (
+    lambda body, level: gzip.compress(body, compresslevel=level, mtime=0),
+    6,
+    9,
+)
+
+
+def negotiate(accept_encoding):
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name] = quality
+
+    best, best_quality = None, 0.0
+    for encoding in CODECS:
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def request_encoding(request):
+    # The encoding a large enough JSON response to ``request`` gets.
+    if not request.path.startswith(PATH_PREFIX):
+        return None
+    return negotiate(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+
+
+def weak_etag(etag):
+    # Same as django.middleware.gzip: the encoded bytes differ from the
+    # identity ones, so the validator becomes weak. Weak comparison keeps
+    # If-None-Match revalidation working.
+    return "W/" + etag if etag.startswith('"') else etag
+
+
+def compress(encoding, body, precompress=False):
+    codec, fast_level, tight_level = CODECS[encoding]
+    started = time.thread_time()
+    compressed = codec(body, tight_level if precompress else fast_level)
+    prefix = f"compression.{encoding}."
+    metrics.incr(prefix + "compressed")
+    metrics.incr(prefix + "cpu_seconds", time.thread_time() - started)
+    return compressed
+
+
+def compressed_body(request, response, encoding):
+    etag = response.get("ETag")
+    if etag is None:
+        return compress(encoding, response.content)
+    # The same ETag can come back from two urls (a catalog with one
+    # restaurant), so the path is part of the key.
+    digest = hashlib.sha1(f"{request.get_full_path()} {etag}".encode()).hexdigest()
+    key = COMPRESSED_KEY.format(encoding, digest)
+    body = cache.get(key)
+    if body is not None:
+        metrics.incr(f"compression.{encoding}.cache_hits")
+        return body
+    body = compress(encoding, response.content, precompress=True)
+    cache.set(
+        key,
+        body,
+        settings.CATALOG_CACHE_TIMEOUT + settings.CATALOG_CACHE_STALE_GRACE,
+    )
+    return body
+
+
+def compress_response(request, response):
+    if (
+        response.streaming
+        or response.status_code != 200
+        or response.has_header("Content-Encoding")
+        or not response.get("Content-Type", "").startswith("application/json")
+        or len(response.content) < settings.COMPRESSION_MIN_SIZE
+    ):
+        return response
+
+    patch_vary_headers(response, ("Accept-Encoding",))
+    encoding = negotiate(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+    if encoding is None:
+        return response
+
+    plain_length = len(response.content)
+    body = compressed_body(request, response, encoding)
+    metrics.incr(f"compression.{encoding}.responses")
+    metrics.incr(f"compression.{encoding}.bytes_in", plain_length)
+    metrics.incr(f"compression.{encoding}.bytes_out", len(body))
+    response.content = body
+    response["Content-Length"] = str(len(body))
+    response["Content-Encoding"] = encoding
+    if response.has_header("ETag"):
+        response["ETag"] = weak_etag(response["ETag"])
+    return response
+
+
+def report():
+    # Ratios and CPU time per encoding, for the metrics endpoint.
+    summary = {}
+    for encoding in CODECS:
+        prefix = f"compression.{encoding}."
+        compressed = metrics.get(prefix + "compressed")
+        summary[encoding] = {
+            "responses": int(metrics.get(prefix + "responses")),
+            "compressions": int(compressed),
+            "cache_hits": int(metrics.get(prefix + "cache_hits")),
+            "ratio": ratio(
+                metrics.get(prefix + "bytes_out"),
+                metrics.get(prefix + "bytes_in"),
+            ),
+            "cpu_ms_per_compression": ratio(
+                metrics.get(prefix + "cpu_seconds") * 1000, compressed
+            ),
+        }
+    return summary
@@ -0,0 +1,84 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_etags
+
+from . import catalog_cache
+from .compression import request_encoding, weak_etag
+
+# Conditional GET for the catalog. Validators are derived from the row count
+# and the newest ``updated_at`` of the rows behind a response, which is a
+# single aggregate over an index instead of fetching and serialising the
+# body. Deletes change the count, inserts and updates move max(updated_at).
+
+
+class Validators:
+    def __init__(self, etag, last_modified):
+        self.etag = etag
+        # Unix timestamp or None when there is nothing to date the body by.
+        self.last_modified = last_modified
+
+    def apply(self, response):
+        # A 304 keeps the ETag not_modified gave it.
+        response.setdefault("ETag", self.etag)
+        if self.last_modified is not None:
+            response["Last-Modified"] = http_date(self.last_modified)
+        return response
+
+
+def make_etag(*parts):
+    digest = hashlib.sha1(":".join(str(part) for part in parts).encode())
+    return f'"{digest.hexdigest()}"'
+
+
+def aggregate_validators(queryset, *stamp_fields, variant=""):
+    # ``stamp_fields`` are the updated_at columns (local or joined) whose
+    # newest value dates the response.
+    stamp_fields = stamp_fields or ("updated_at",)
+    aggregates = {
+        f"last_{index}": Max(field) for index, field in enumerate(stamp_fields)
+    }
+    result = queryset.aggregate(count=Count("pk"), **aggregates)
+    stamps = [result[name] for name in aggregates if result[name] is not None]
+    last = max(stamps) if stamps else None
+    return Validators(
+        make_etag(result["count"], last.isoformat() if last else "-", variant),
+        int(last.timestamp()) if last else None,
+    )
+
+
+def catalog_validators(scope, params, queryset, *stamp_fields):
+    # Validators live in the versioned catalog cache next to the body, so a
+    # revalidation that ends in a 304 does not touch the database at all.
+    return catalog_cache.read(
+        scope,
+        params,
+        lambda: aggregate_validators(
+            queryset, *stamp_fields, variant=catalog_cache.variant_key(params)
+        ),
+        name="validators",
+    )
+
+
+def not_modified(request, validators):
+    # Returns a 304 when the client's If-None-Match / If-Modified-Since
+    # already matches, otherwise None and the view goes on to build the body.
+    response = get_conditional_response(
+        request, etag=validators.etag, last_modified=validators.last_modified
+    )
+    if response is not None:
+        response["ETag"] = _cached_etag(request, validators.etag)
+    return response
+
+
+def _cached_etag(request, etag):
+    # A 304 carries the ETag of the 200 the client holds, which compression
+    # weakened if it encoded the body. Echo the form the client revalidates
+    # with, and without If-None-Match assume it got what we would send now.
+    sent = parse_etags(request.META.get("HTTP_IF_NONE_MATCH", ""))
+    if weak_etag(etag) in sent:
+        return weak_etag(etag)
+    if etag in sent or request_encoding(request) is None:
+        return etag
+    return weak_etag(etag)
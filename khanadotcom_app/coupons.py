@@ -0,0 +1,178 @@
+import heapq
+import threading
+from collections import namedtuple
+from datetime import timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from . import catalog_cache
+from .metrics import metrics
+from .models import Coupon
+
+# In-process coupon index for checkout.
+#
+# Live coupons are held in a dict keyed by their normalised code, so applying
+# one at checkout is a dict lookup instead of a query. A heap ordered by
+# valid_to drops coupons as they expire, again without touching the
+# database. Every process keeps its own copy: the writing process updates it
+# from model signals, the others notice the shared "coupons" version moved
+# and reload the rows changed since their last sync.
+#
+# Redemptions are counted with cache.incr, atomic across processes; the
+# orders themselves record the coupon, so the counters can always be
+# rebuilt from the database.
+
+SYNC_OVERLAP = timedelta(seconds=2)
+REDEMPTIONS_KEY = "coupon:{}:redemptions"
+CENT = Decimal("0.01")
+
+COUPON_COLUMNS = (
+    "coupon_id",
+    "code",
+    "discount_percentage",
+    "max_discount_amount",
+    "valid_from",
+    "valid_to",
+)
+
+LiveCoupon = namedtuple("LiveCoupon", COUPON_COLUMNS)
+
+
+class InvalidCoupon(ValueError):
+    def __init__(self, code):
+        self.code = code
+        super().__init__(f"Coupon {code} is not valid.")
+
+
+def normalise(code):
+    return code.strip().upper()
+
+
+def discount_for(coupon, amount):
+    discount = (amount * coupon.discount_percentage / 100).quantize(
+        CENT, rounding=ROUND_HALF_UP
+    )
+    if coupon.max_discount_amount is not None:
+        discount = min(discount, coupon.max_discount_amount)
+    return min(discount, amount)
+
+
+class CouponIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_code = None  # normalised code -> LiveCoupon
+        self._codes = {}  # coupon_id -> normalised code
+        self._expiry = []  # heap of (valid_to, coupon_id)
+        self._version = None
+        self._synced_at = None
+
+    def _remove(self, coupon_id):
+        code = self._codes.pop(coupon_id, None)
+        if code is not None:
+            del self._by_code[code]
+
+    def _load(self, coupons, now):
+        for row in coupons.values_list(*COUPON_COLUMNS, "active"):
+            coupon = LiveCoupon(*row[:-1])
+            self._remove(coupon.coupon_id)
+            if not row[-1] or coupon.valid_to <= now:
+                continue
+            code = normalise(coupon.code)
+            # Codes are unique, but a rename may reach us before the row
+            # that used to hold the code.
+            if code in self._by_code:
+                self._remove(self._by_code[code].coupon_id)
+            self._by_code[code] = coupon
+            self._codes[coupon.coupon_id] = code
+            heapq.heappush(self._expiry, (coupon.valid_to, coupon.coupon_id))
+
+    def _expire(self, now):
+        while self._expiry and self._expiry[0][0] <= now:
+            valid_to, coupon_id = heapq.heappop(self._expiry)
+            code = self._codes.get(coupon_id)
+            # Entries left behind by an update carry an old valid_to.
+            if code is not None and self._by_code[code].valid_to == valid_to:
+                self._remove(coupon_id)
+
+    def build(self):
+        version = catalog_cache.scope_version("coupons")
+        synced_at = timezone.now()
+        self._by_code, self._codes, self._expiry = {}, {}, []
+        self._load(
+            Coupon.objects.filter(active=True, valid_to__gt=synced_at), synced_at
+        )
+        self._version, self._synced_at = version, synced_at
+
+    def sync(self):
+        version = catalog_cache.scope_version("coupons")
+        if version == self._version:
+            return
+        since = self._synced_at - SYNC_OVERLAP
+        synced_at = timezone.now()
+        self._load(Coupon.objects.filter(updated_at__gte=since), synced_at)
+        # Deletes leave no row to notice by updated_at.
+        present = set(
+            Coupon.objects.filter(pk__in=list(self._codes)).values_list("pk", flat=True)
+        )
+        for coupon_id in set(self._codes) - present:
+            self._remove(coupon_id)
+        self._version, self._synced_at = version, synced_at
+
+    def lookup(self, code, now=None):
+        # The coupon behind ``code`` if it can be used right now. Raises
+        # InvalidCoupon otherwise.
+        if not isinstance(code, str):
+            # A JSON body can carry anything.
+            metrics.incr("coupons.rejected")
+            raise InvalidCoupon(code)
+        now = now or timezone.now()
+        with self._lock:
+            if self._by_code is None:
+                self.build()
+            else:
+                self.sync()
+            self._expire(now)
+            coupon = self._by_code.get(normalise(code))
+        if coupon is None or coupon.valid_from > now:
+            metrics.incr("coupons.rejected")
+            raise InvalidCoupon(code)
+        return coupon
+
+    # Signal hooks, see search.CatalogSearch for the versioning dance.
+
+    def _applied(self):
+        (version,) = catalog_cache.bump("coupons")
+        if self._version == version - 1:
+            self._version = version
+
+    def coupon_changed(self, coupon_id):
+        with self._lock:
+            if self._by_code is not None:
+                self._load(Coupon.objects.filter(pk=coupon_id), timezone.now())
+            self._applied()
+
+    def coupon_deleted(self, coupon_id):
+        with self._lock:
+            if self._by_code is not None:
+                self._remove(coupon_id)
+            self._applied()
+
+
+coupon_index = CouponIndex()
+
+
+def redeemed(coupon_id):
+    key = REDEMPTIONS_KEY.format(coupon_id)
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Evicted between the add and the incr.
+        cache.set(key, 1, None)
+    metrics.incr("coupons.redeemed")
+
+
+def redemptions(coupon_id):
+    return cache.get(REDEMPTIONS_KEY.format(coupon_id), 0)
@@ -0,0 +1,126 @@
+import time
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import order_state
+from .metrics import metrics, ratio
+from .models import DeliveryPerson, Order
+
+# Delivery dispatch.
+#
+# Drivers (and, for batches, orders) are claimed with
+# SELECT ... FOR UPDATE SKIP LOCKED inside the assigning transaction. Parallel
+# dispatchers never block on each other and never see the same row: each one
+# walks past whatever the others hold and takes the next free driver, instead
+# of every caller queueing on the first available row.
+
+
+def _claim_drivers(count):
+    return list(
+        DeliveryPerson.objects.select_for_update(skip_locked=True)
+        .filter(availability_status=True)
+        .order_by("pk")
+        .values_list("pk", flat=True)[:count]
+    )
+
+
+def _record(started, assigned, unassigned, conflicts=0):
+    elapsed = time.perf_counter() - started
+    metrics.incr("dispatch.runs")
+    metrics.incr("dispatch.assigned", assigned)
+    metrics.incr("dispatch.unassigned", unassigned)
+    metrics.incr("dispatch.conflicts", conflicts)
+    metrics.incr("dispatch.seconds", elapsed)
+    metrics.maximum("dispatch.max_seconds", elapsed)
+
+
+def assign_order(order_id):
+    # Assigns one confirmed order. Returns the driver id, or None when no
+    # driver is free. Raises InvalidTransition when the order is no longer
+    # confirmed, in which case the claimed driver is released by the
+    # rollback.
+    started = time.perf_counter()
+    try:
+        with transaction.atomic():
+            drivers = _claim_drivers(1)
+            if not drivers:
+                _record(started, 0, 1)
+                return None
+            order_state.transition(
+                order_id,
+                "out_for_delivery",
+                expected="confirmed",
+                delivery_person_id=drivers[0],
+            )
+            DeliveryPerson.objects.filter(pk=drivers[0]).update(
+                availability_status=False
+            )
+    except order_state.InvalidTransition:
+        _record(started, 0, 0, conflicts=1)
+        raise
+    _record(started, 1, 0)
+    return drivers[0]
+
+
+def _status_changed(pairs, now):
+    for order_id, _ in pairs:
+        order_state.status_changed(order_id, "out_for_delivery", now)
+
+
+def pair_in_order(orders, drivers):
+    # Oldest order first, drivers in claim order.
+    return list(zip(orders, drivers))
+
+
+def assign_batch(limit=100, match=pair_in_order, candidates=None):
+    # Assigns up to ``limit`` confirmed orders in one transaction and returns
+    # [(order_id, driver_id)]. ``match(order_ids, driver_ids)`` picks the
+    # pairs out of ``candidates`` claimed drivers (one per order by default);
+    # both lists are locked for the whole pass, so the writes are plain bulk
+    # updates and drivers left unmatched are released on commit.
+    started = time.perf_counter()
+    with transaction.atomic():
+        order_ids = list(
+            Order.objects.select_for_update(skip_locked=True)
+            .filter(order_status="confirmed")
+            .order_by("order_date", "pk")
+            .values_list("pk", flat=True)[:limit]
+        )
+        if not order_ids:
+            _record(started, 0, 0)
+            return []
+        driver_ids = _claim_drivers(max(candidates or 0, len(order_ids)))
+        pairs = match(order_ids, driver_ids) if driver_ids else []
+        if pairs:
+            now = timezone.now()
+            Order.objects.bulk_update(
+                [
+                    Order(
+                        pk=order_id,
+                        order_status="out_for_delivery",
+                        delivery_person_id=driver_id,
+                        updated_at=now,
+                    )
+                    for order_id, driver_id in pairs
+                ],
+                ["order_status", "delivery_person", "updated_at"],
+            )
+            DeliveryPerson.objects.filter(
+                pk__in=[driver_id for _, driver_id in pairs]
+            ).update(availability_status=False)
+            transaction.on_commit(lambda: _status_changed(pairs, now))
+    _record(started, len(pairs), len(order_ids) - len(pairs))
+    return pairs
+
+
+def report():
+    runs = metrics.get("dispatch.runs")
+    return {
+        "runs": int(runs),
+        "assigned": int(metrics.get("dispatch.assigned")),
+        "unassigned": int(metrics.get("dispatch.unassigned")),
+        "conflicts": int(metrics.get("dispatch.conflicts")),
+        "avg_ms": ratio(metrics.get("dispatch.seconds") * 1000, runs),
+        "max_ms": round(metrics.get("dispatch.max_seconds") * 1000, 3),
+    }
@@ -0,0 +1,203 @@
+import numpy as np
+from django.conf import settings
+
+from .geo import EARTH_RADIUS_KM
+from .models import DeliveryPerson, Order
+
+# Batch dispatch as an assignment problem.
+#
+# Every pass builds a cost matrix of confirmed orders x free drivers, where a
+# pair costs the driver's distance to the restaurant minus a bonus for the
+# driver's rating, and picks the set of pairs with the lowest total cost.
+# Square problems go to an epsilon-scaling auction on integer costs,
+# vectorised over all unassigned bidders at once. Rectangular ones (more
+# drivers than orders, the usual case) go to a shortest augmenting path
+# solver, which finds a free driver within a few steps per order there.
+# With nothing but NumPy, a 1k x 1k city solves in roughly 0.5 to 0.8 s
+# depending on the data and the machine, 500 x 2k in about 50 ms; see
+# `manage.py benchmark_dispatch`.
+
+UNASSIGNED = -1
+
+
+def haversine_matrix(lat1, lng1, lat2, lng2):
+    # Great-circle distances (km) between every point of set 1 (rows) and
+    # set 2 (columns). NaN coordinates give NaN distances.
+    lat1, lng1 = np.radians(lat1)[:, None], np.radians(lng1)[:, None]
+    lat2, lng2 = np.radians(lat2)[None, :], np.radians(lng2)[None, :]
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def cost_matrix(order_points, driver_points, driver_ratings):
+    # Integer costs in metres. Unknown locations count as far away so they
+    # are only used when nothing better is left.
+    distance = haversine_matrix(
+        order_points[:, 0], order_points[:, 1], driver_points[:, 0], driver_points[:, 1]
+    )
+    distance = np.nan_to_num(distance, nan=settings.DISPATCH_UNKNOWN_DISTANCE_KM)
+    cost = distance - settings.DISPATCH_RATING_WEIGHT_KM * driver_ratings[None, :]
+    return np.rint(cost * 1000).astype(np.int64)
+
+
+def _auction(benefit):
+    # Maximum-benefit perfect matching of a square integer matrix. Benefits
+    # are scaled by (n + 1) so that the final eps of 1 is below the
+    # resolution of the original integers, which makes the result optimal.
+    n = len(benefit)
+    if n == 1:
+        return np.zeros(1, dtype=np.int64)
+    scaled = (benefit - benefit.min()) * (n + 1)
+    prices = np.zeros(n, dtype=np.int64)
+    # Starting at 1/16 of the range measured fastest on city-shaped data.
+    eps = max(1, int(scaled.max()) // 16)
+    rows = np.arange(n)
+    while True:
+        owner = np.full(n, UNASSIGNED)
+        assigned = np.full(n, UNASSIGNED)
+        bidders = rows
+        while bidders.size:
+            values = scaled[bidders] - prices
+            best = values.argmax(axis=1)
+            picked = np.arange(bidders.size)
+            best_value = values[picked, best]
+            values[picked, best] = np.iinfo(np.int64).min
+            second_value = values.max(axis=1)
+            bids = prices[best] + best_value - second_value + eps
+
+            # Highest bid per object wins; sort by (object, bid) and keep
+            # the last entry of every object.
+            order = np.lexsort((bids, best))
+            last = np.r_[best[order][1:] != best[order][:-1], True]
+            winners = order[last]
+            objects = best[winners]
+
+            outbid = owner[objects]
+            assigned[outbid[outbid != UNASSIGNED]] = UNASSIGNED
+            owner[objects] = bidders[winners]
+            assigned[bidders[winners]] = objects
+            prices[objects] = bids[winners]
+            bidders = rows[assigned == UNASSIGNED]
+        if eps == 1:
+            return assigned
+        eps = max(1, eps // 4)
+
+
+def _augmenting_paths(cost):
+    # Minimum-cost matching of every row of an n x m matrix with n <= m, one
+    # Dijkstra-like search per row over reduced costs (Jonker-Volgenant
+    # without the initialisation heuristics). Returns the column of each row.
+    n, m = cost.shape
+    cost = cost.astype(np.float64)
+    row_dual = np.zeros(n)
+    column_dual = np.zeros(m)
+    column_of = np.full(n, UNASSIGNED)
+    row_of = np.full(m, UNASSIGNED)
+    for start in range(n):
+        shortest = np.full(m, np.inf)
+        path = np.full(m, UNASSIGNED)
+        remaining = np.ones(m, dtype=bool)
+        visited_rows = []
+        row, reached = start, 0.0
+        while True:
+            reduced = reached + cost[row] - row_dual[row] - column_dual
+            shorter = remaining & (reduced < shortest)
+            path[shorter] = row
+            shortest[shorter] = reduced[shorter]
+            candidates = np.where(remaining, shortest, np.inf)
+            column = int(candidates.argmin())
+            reached = candidates[column]
+            if row_of[column] != UNASSIGNED:
+                # Among equally short columns, stop at a free one.
+                free = np.flatnonzero((candidates == reached) & (row_of == UNASSIGNED))
+                if free.size:
+                    column = int(free[0])
+            remaining[column] = False
+            if row_of[column] == UNASSIGNED:
+                break
+            row = row_of[column]
+            visited_rows.append(row)
+
+        row_dual[start] += reached
+        if visited_rows:
+            visited = np.array(visited_rows)
+            row_dual[visited] += reached - shortest[column_of[visited]]
+        scanned = ~remaining
+        scanned[column] = False
+        column_dual[scanned] -= reached - shortest[scanned]
+
+        while True:
+            row = path[column]
+            row_of[column] = row
+            column_of[row], column = column, column_of[row]
+            if row == start:
+                break
+    return column_of
+
+
+def solve(cost):
+    # Returns [(row, column)] pairs of minimum total cost, one per row or
+    # column, whichever is fewer.
+    cost = np.asarray(cost, dtype=np.int64)
+    if not cost.size:
+        return []
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    n, m = cost.shape
+
+    # Some optimal matching only uses, for every row, one of its n cheapest
+    # columns (any other column could be swapped for a free one of those),
+    # so the rest can be dropped up front.
+    columns = np.arange(m)
+    if m > n:
+        nearest = np.argpartition(cost, n - 1, axis=1)[:, :n]
+        columns = np.unique(nearest)
+    pruned = cost[:, columns]
+    if len(columns) == n:
+        assigned = _auction(-pruned)
+    else:
+        assigned = _augmenting_paths(pruned)
+
+    pairs = [(row, int(columns[column])) for row, column in enumerate(assigned)]
+    if transposed:
+        pairs = [(column, row) for row, column in pairs]
+    return sorted(pairs)
+
+
+def _order_points(order_ids):
+    # Pickup point of an order: its restaurant.
+    points = np.full((len(order_ids), 2), np.nan)
+    index = {order_id: i for i, order_id in enumerate(order_ids)}
+    for order_id, lat, lng in Order.objects.filter(
+        pk__in=order_ids, restaurant__latitude__isnull=False
+    ).values_list("pk", "restaurant__latitude", "restaurant__longitude"):
+        points[index[order_id]] = (float(lat), float(lng))
+    return points
+
+
+def _driver_points(driver_ids):
+    rows = {
+        pk: (lat, lng, rating)
+        for pk, lat, lng, rating in DeliveryPerson.objects.filter(
+            pk__in=driver_ids
+        ).values_list("pk", "latitude", "longitude", "rating")
+    }
+    points = np.full((len(driver_ids), 2), np.nan)
+    ratings = np.zeros(len(driver_ids))
+    for i, driver_id in enumerate(driver_ids):
+        lat, lng, rating = rows[driver_id]
+        if lat is not None and lng is not None:
+            points[i] = (float(lat), float(lng))
+        ratings[i] = float(rating)
+    return points, ratings
+
+
+def optimal_pairs(order_ids, driver_ids):
+    # ``match`` for dispatch.assign_batch.
+    driver_points, ratings = _driver_points(driver_ids)
+    cost = cost_matrix(_order_points(order_ids), driver_points, ratings)
+    return [(order_ids[row], driver_ids[column]) for row, column in solve(cost)]
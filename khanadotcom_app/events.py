@@ -0,0 +1,211 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
+from .metrics import metrics
+
+# Pub/sub for live order updates.
+#
+# Status changes are published to a per-order channel once their transaction
+# commits, and the /order/<id>/events/ stream pushes them to the client as
+# Server-Sent Events instead of the client polling for them. New orders are
+# published to a per-restaurant channel that wakes up the owner's
+# long-polling order queue. The hub is picked with ORDER_EVENTS_HUB:
+#
+#   InProcessHub  subscribers and publishers share one process (one ASGI
+#                 worker, or a threaded dev server). Delivery is a queue put.
+#   CacheHub      any number of processes sharing the Django cache; each
+#                 stream polls a per-channel sequence number.
+
+TERMINAL_STATUSES = ("delivered", "cancelled")
+
+SEQUENCE_KEY = "events:{}:sequence"
+EVENT_KEY = "events:{}:{}"
+SEQUENCE_TTL = 24 * 60 * 60
+EVENT_TTL = 5 * 60
+
+
+def order_channel(order_id):
+    return f"order:{order_id}"
+
+
+def restaurant_channel(restaurant_id):
+    return f"restaurant:{restaurant_id}"
+
+
+class _QueueSubscription:
+    def __init__(self, hub, channel):
+        self.hub = hub
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+
+    async def get(self, timeout):
+        # Next message, or None when nothing arrived within ``timeout``.
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.hub._unsubscribe(self)
+
+
+class InProcessHub:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    async def subscribe(self, channel):
+        subscription = _QueueSubscription(self, channel)
+        with self._lock:
+            self._subscribers[channel].add(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+    def publish(self, channel, message):
+        # Safe to call from any thread; every subscriber's queue is fed on
+        # its own event loop.
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        delivered = 0
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(
+                    subscription.queue.put_nowait, message
+                )
+                delivered += 1
+            except RuntimeError:
+                # The stream's loop is gone without it unsubscribing.
+                self._unsubscribe(subscription)
+        return delivered
+
+
+class _CacheSubscription:
+    def __init__(self, channel, position):
+        self.channel = channel
+        self.position = position
+
+    async def get(self, timeout):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            latest = await cache.aget(SEQUENCE_KEY.format(self.channel), 0)
+            if latest < self.position:
+                # The sequence expired and started over.
+                self.position = latest
+            while latest > self.position:
+                self.position += 1
+                message = await cache.aget(
+                    EVENT_KEY.format(self.channel, self.position)
+                )
+                if message is not None:
+                    return message
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return None
+            await asyncio.sleep(min(settings.ORDER_EVENTS_POLL_INTERVAL, remaining))
+
+    def close(self):
+        pass
+
+
+class CacheHub:
+    async def subscribe(self, channel):
+        position = await cache.aget(SEQUENCE_KEY.format(channel), 0)
+        return _CacheSubscription(channel, position)
+
+    def publish(self, channel, message):
+        key = SEQUENCE_KEY.format(channel)
+        cache.add(key, 0, SEQUENCE_TTL)
+        try:
+            sequence = cache.incr(key)
+        except ValueError:
+            # Expired between the add and the incr.
+            sequence = 1
+            cache.set(key, sequence, SEQUENCE_TTL)
+        cache.set(EVENT_KEY.format(channel, sequence), message, EVENT_TTL)
+
+
+_hubs = {}
+
+
+def get_hub():
+    path = settings.ORDER_EVENTS_HUB
+    if path not in _hubs:
+        _hubs[path] = import_string(path)()
+    return _hubs[path]
+
+
+def status_message(order_id, order_status, updated_at):
+    return {
+        "order_id": order_id,
+        "status": order_status,
+        "updated_at": updated_at.isoformat() if updated_at else None,
+    }
+
+
+def publish(channel, message):
+    delivered = get_hub().publish(channel, message)
+    metrics.incr("events.published")
+    if delivered:
+        metrics.incr("events.delivered", delivered)
+
+
+def publish_order_status(order_id, order_status, updated_at):
+    publish(order_channel(order_id), status_message(order_id, order_status, updated_at))
+
+
+def publish_new_order(restaurant_id, order):
+    # Wakes up the restaurant's long-polling order queue.
+    publish(
+        restaurant_channel(restaurant_id),
+        status_message(order.pk, order.order_status, order.created_at),
+    )
+
+
+def format_event(message, event="status"):
+    data = json.dumps(message, separators=(",", ":"))
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+async def order_status_stream(subscription, current):
+    # Sends the current status, then every change until the order reaches a
+    # terminal status or ORDER_EVENTS_MAX_SECONDS pass, with a comment line
+    # as heartbeat whenever the stream has been quiet for
+    # ORDER_EVENTS_HEARTBEAT seconds. Clients reconnect after the
+    # ``retry`` delay and get the current status again.
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.ORDER_EVENTS_MAX_SECONDS
+    metrics.incr("events.streams")
+    try:
+        yield f"retry: {settings.ORDER_EVENTS_RETRY_MS}\n" + format_event(current)
+        if current["status"] in TERMINAL_STATUSES:
+            return
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            message = await subscription.get(
+                min(settings.ORDER_EVENTS_HEARTBEAT, remaining)
+            )
+            if message is None:
+                yield ": heartbeat\n\n"
+                continue
+            yield format_event(message)
+            if message["status"] in TERMINAL_STATUSES:
+                return
+    finally:
+        subscription.close()
@@ -0,0 +1,81 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from .models import Category, MenuItem, MenuItemCategory, RestaurantCategoryCount
+
+# Counter columns behind the category facets.
+#
+# Category.item_count and RestaurantCategoryCount.item_count are moved by
+# +1 / -1 from the MenuItemCategory (and MenuItem) signals, inside the same
+# transaction as the write, so the facet endpoints read plain rows instead of
+# running COUNT(*) ... GROUP BY on every request. ``rebuild`` recomputes them
+# from scratch, see the rebuild_category_counts command.
+
+
+def _shift_restaurant(restaurant_id, category_id, delta):
+    if restaurant_id is None:
+        return
+    counters = RestaurantCategoryCount.objects.filter(
+        restaurant_id=restaurant_id, category_id=category_id
+    )
+    if counters.update(item_count=F("item_count") + delta) or delta < 0:
+        # A missing row on the way down means the restaurant or category is
+        # being deleted along with it, there is nothing left to count.
+        return
+    try:
+        with transaction.atomic():
+            RestaurantCategoryCount.objects.create(
+                restaurant_id=restaurant_id, category_id=category_id, item_count=delta
+            )
+    except IntegrityError:
+        # Created concurrently by another writer.
+        counters.update(item_count=F("item_count") + delta)
+
+
+def shift(restaurant_id, category_id, delta):
+    Category.objects.filter(pk=category_id).update(item_count=F("item_count") + delta)
+    _shift_restaurant(restaurant_id, category_id, delta)
+
+
+def restaurant_of(menu_item_id):
+    return (
+        MenuItem.objects.filter(pk=menu_item_id)
+        .values_list("restaurant_id", flat=True)
+        .first()
+    )
+
+
+def menu_item_moved(menu_item_id, old_restaurant_id, new_restaurant_id):
+    # A menu item changed restaurants: its category links now count for the
+    # new one. The per-category totals are unchanged.
+    for category_id in MenuItemCategory.objects.filter(
+        menu_item_id=menu_item_id
+    ).values_list("category_id", flat=True):
+        _shift_restaurant(old_restaurant_id, category_id, -1)
+        _shift_restaurant(new_restaurant_id, category_id, 1)
+
+
+def rebuild():
+    with transaction.atomic():
+        Category.objects.update(item_count=0)
+        for row in (
+            MenuItemCategory.objects.values("category_id")
+            .annotate(items=Count("pk"))
+            .order_by()
+        ):
+            Category.objects.filter(pk=row["category_id"]).update(
+                item_count=row["items"]
+            )
+        RestaurantCategoryCount.objects.all().delete()
+        RestaurantCategoryCount.objects.bulk_create(
+            RestaurantCategoryCount(
+                restaurant_id=row["menu_item__restaurant_id"],
+                category_id=row["category_id"],
+                item_count=row["items"],
+            )
+            for row in MenuItemCategory.objects.values(
+                "menu_item__restaurant_id", "category_id"
+            )
+            .annotate(items=Count("pk"))
+            .order_by()
+        )
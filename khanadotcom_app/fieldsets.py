@@ -0,0 +1,43 @@
+# Sparse fieldsets. Clients pick the keys they want with ``?fields=id,name``
+# or drop some with ``?exclude=description``; views map the selection back to
+# columns so the database never sends what the response would throw away.
+
+
+def _names(request, param):
+    value = request.query_params.get(param)
+    if value is None:
+        return None
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+# Returns the requested response fields in the order of ``available``, or
+# ``available`` itself when the client did not ask for a subset.
+def requested_fields(request, available):
+    wanted = _names(request, "fields")
+    excluded = _names(request, "exclude")
+    if wanted is None and excluded is None:
+        return tuple(available)
+
+    unknown = [
+        name for name in (wanted or []) + (excluded or []) if name not in available
+    ]
+    if unknown:
+        raise ValueError(
+            "Unknown field(s): "
+            + ", ".join(unknown)
+            + ". Choose from: "
+            + ", ".join(available)
+            + "."
+        )
+    fields = tuple(
+        name
+        for name in available
+        if (wanted is None or name in wanted) and name not in (excluded or ())
+    )
+    if not fields:
+        raise ValueError("No fields left to return.")
+    return fields
+
+
+def is_sparse(request):
+    return "fields" in request.query_params or "exclude" in request.query_params
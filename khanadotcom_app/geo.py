@@ -0,0 +1,257 @@
+import heapq
+import math
+import threading
+from datetime import timedelta
+
+from django.utils import timezone
+
+from . import catalog_cache
+from .catalog import RESTAURANT_LIST_COLUMNS, serialize_restaurant
+from .models import Restaurant
+
+# In-memory spatial grid over restaurant locations.
+#
+# The map is cut into fixed cells of CELL_DEGREES on each side and every
+# restaurant sits in the bucket of its cell. A nearby query walks rings of
+# cells outwards from the customer's cell and stops once the k-th nearest
+# hit is closer than anything the next ring could hold, so it only ever
+# looks at restaurants in the neighbourhood instead of scanning the table.
+#
+# Longitudes are not wrapped at the antimeridian, which is fine for the
+# regions we serve.
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+CELL_DEGREES = 0.01  # about 1.1 km north-south
+SYNC_OVERLAP = timedelta(seconds=2)
+
+MIN_ROW = math.floor(-90 / CELL_DEGREES)
+MAX_ROW = math.floor(90 / CELL_DEGREES)
+HALF_TURN_CELLS = math.ceil(180 / CELL_DEGREES)
+MIN_KX = 1e-6  # km per degree of longitude, right at the poles
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def parse_coordinates(lat, lng):
+    # Both or neither: returns (None, None) when no coordinates were sent.
+    if lat in (None, "") and lng in (None, ""):
+        return None, None
+    try:
+        lat, lng = float(lat), float(lng)
+    except (TypeError, ValueError):
+        raise ValueError("Latitude and longitude must both be numbers.")
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError("Latitude or longitude is out of range.")
+    return lat, lng
+
+
+def cell_of(lat, lng):
+    return (math.floor(lat / CELL_DEGREES), math.floor(lng / CELL_DEGREES))
+
+
+class GridIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._cells = {}  # (row, col) -> {restaurant_id: (lat, lng)}
+        self._entries = {}  # restaurant_id -> (cell, payload)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def ids(self):
+        with self._lock:
+            return set(self._entries)
+
+    def upsert(self, restaurant_id, lat, lng, payload):
+        with self._lock:
+            self.remove(restaurant_id)
+            cell = cell_of(lat, lng)
+            self._cells.setdefault(cell, {})[restaurant_id] = (lat, lng)
+            self._entries[restaurant_id] = (cell, payload)
+
+    def remove(self, restaurant_id):
+        with self._lock:
+            entry = self._entries.pop(restaurant_id, None)
+            if entry is None:
+                return
+            bucket = self._cells[entry[0]]
+            del bucket[restaurant_id]
+            if not bucket:
+                del self._cells[entry[0]]
+
+    def _ring(self, center, radius, bounds):
+        # The cells ``radius`` steps from ``center``, clipped to ``bounds``.
+        row, col = center
+        row_lo, row_hi, col_lo, col_hi = bounds
+        if radius == 0:
+            yield center
+            return
+        cols = range(max(col - radius, col_lo), min(col + radius, col_hi) + 1)
+        for r in (row - radius, row + radius):
+            if row_lo <= r <= row_hi:
+                for c in cols:
+                    yield (r, c)
+        rows = range(max(row - radius + 1, row_lo), min(row + radius - 1, row_hi) + 1)
+        for c in (col - radius, col + radius):
+            if col_lo <= c <= col_hi:
+                for r in rows:
+                    yield (r, c)
+
+    def nearest(self, lat, lng, radius_km, limit):
+        # Candidates are ranked on a flat projection around the query point,
+        # which is cheaper than haversine and indistinguishable from it over
+        # a few tens of kilometres. Distances are compared squared.
+        ky = KM_PER_DEGREE
+        kx = KM_PER_DEGREE * math.cos(math.radians(lat))
+        row, col = center = cell_of(lat, lng)
+        north, south = (row + 1) * CELL_DEGREES - lat, lat - row * CELL_DEGREES
+        east, west = (col + 1) * CELL_DEGREES - lng, lng - col * CELL_DEGREES
+        radius_sq = radius_km * radius_km
+
+        # Every cell that can hold a hit. Near the poles a degree of
+        # longitude shrinks towards nothing, so the columns are capped at a
+        # full turn instead of growing without bound.
+        rows = math.ceil(radius_km / (ky * CELL_DEGREES)) + 1
+        columns = min(
+            math.ceil(radius_km / (max(kx, MIN_KX) * CELL_DEGREES)) + 1,
+            HALF_TURN_CELLS,
+        )
+        bounds = (
+            max(row - rows, MIN_ROW),
+            min(row + rows, MAX_ROW),
+            col - columns,
+            col + columns,
+        )
+        row_lo, row_hi, col_lo, col_hi = bounds
+
+        best = []  # max-heap via negation: (-distance_sq, restaurant_id)
+
+        def consider(bucket):
+            for restaurant_id, (r_lat, r_lng) in bucket.items():
+                dy = (r_lat - lat) * ky
+                dx = (r_lng - lng) * kx
+                distance_sq = dx * dx + dy * dy
+                if distance_sq > radius_sq:
+                    continue
+                hit = (-distance_sq, restaurant_id)
+                if len(best) < limit:
+                    heapq.heappush(best, hit)
+                elif hit > best[0]:
+                    heapq.heapreplace(best, hit)
+
+        with self._lock:
+            if (row_hi - row_lo + 1) * (col_hi - col_lo + 1) > len(self._cells):
+                # Fewer restaurant cells than cells in reach: look at those.
+                for (r, c), bucket in self._cells.items():
+                    if row_lo <= r <= row_hi and col_lo <= c <= col_hi:
+                        consider(bucket)
+            else:
+                for ring in range(max(rows, columns) + 1):
+                    if ring:
+                        # Nothing in this ring is closer than its inner edge.
+                        step = (ring - 1) * CELL_DEGREES
+                        gap = min(
+                            (min(north, south) + step) * ky,
+                            (min(east, west) + step) * kx,
+                        )
+                        gap_sq = gap * gap
+                        if gap_sq > radius_sq or (
+                            len(best) == limit and gap_sq > -best[0][0]
+                        ):
+                            break
+                    for cell in self._ring(center, ring, bounds):
+                        bucket = self._cells.get(cell)
+                        if bucket:
+                            consider(bucket)
+            hits = []
+            for _, restaurant_id in best:
+                cell, payload = self._entries[restaurant_id]
+                distance = haversine_km(lat, lng, *self._cells[cell][restaurant_id])
+                hits.append(dict(payload, distance_km=round(distance, 3)))
+        hits.sort(key=lambda hit: (hit["distance_km"], -hit["rating"]))
+        return hits
+
+
+class NearbyRestaurants:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.index = None
+        self._version = None
+        self._synced_at = None
+
+    def _load(self, restaurants):
+        for row in restaurants.values(
+            *RESTAURANT_LIST_COLUMNS, "latitude", "longitude", "is_deleted"
+        ):
+            restaurant_id = row["restaurant_id"]
+            if row["is_deleted"] or row["latitude"] is None or row["longitude"] is None:
+                self.index.remove(restaurant_id)
+                continue
+            payload = serialize_restaurant(row)
+            payload["rating"] = float(payload["rating"])
+            payload["latitude"] = float(row["latitude"])
+            payload["longitude"] = float(row["longitude"])
+            self.index.upsert(
+                restaurant_id, payload["latitude"], payload["longitude"], payload
+            )
+
+    def build(self):
+        version = catalog_cache.scope_version("geo")
+        synced_at = timezone.now()
+        self.index = GridIndex()
+        self._load(Restaurant.objects.all())
+        self._version, self._synced_at = version, synced_at
+
+    def sync(self):
+        # Pick up restaurants written by other processes since our last
+        # build or sync.
+        version = catalog_cache.scope_version("geo")
+        if version == self._version:
+            return
+        since = self._synced_at - SYNC_OVERLAP
+        synced_at = timezone.now()
+        self._load(Restaurant.objects.filter(updated_at__gte=since))
+        # Deletes leave no row to notice by updated_at.
+        indexed = self.index.ids()
+        present = set(
+            Restaurant.objects.filter(pk__in=indexed).values_list("pk", flat=True)
+        )
+        for restaurant_id in indexed - present:
+            self.index.remove(restaurant_id)
+        self._version, self._synced_at = version, synced_at
+
+    def nearest(self, lat, lng, radius_km, limit):
+        with self._lock:
+            if self.index is None:
+                self.build()
+            else:
+                self.sync()
+        return self.index.nearest(lat, lng, radius_km, limit)
+
+    # Signal hooks, see search.CatalogSearch for the versioning dance.
+
+    def _applied(self):
+        (version,) = catalog_cache.bump("geo")
+        if self._version == version - 1:
+            self._version = version
+
+    def restaurant_changed(self, restaurant_id):
+        if self.index is not None:
+            self._load(Restaurant.objects.filter(pk=restaurant_id))
+        self._applied()
+
+    def restaurant_deleted(self, restaurant_id):
+        if self.index is not None:
+            self.index.remove(restaurant_id)
+        self._applied()
+
+
+nearby_restaurants = NearbyRestaurants()
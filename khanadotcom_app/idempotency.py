@@ -0,0 +1,114 @@
+import functools
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+from .metrics import metrics
+
+# Idempotency-Key support for write endpoints.
+#
+# The first request with a given key runs the view and its response is kept
+# in the cache for IDEMPOTENCY_KEY_TTL seconds, together with a fingerprint
+# of the request. A retry with the same key and body gets that response back
+# from a single cache read, without running the view again. A duplicate that
+# arrives while the first attempt is still running waits for its result.
+# Keys are scoped to the user and the path.
+
+RECORD_KEY = "idempotency:{}"
+LOCK_SUFFIX = ":lock"
+LOCK_TIMEOUT = 30
+LOCK_WAIT = 0.05
+MAX_KEY_LENGTH = 255
+
+
+def fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha1(f"{request.method} {request.path} {body}".encode()).hexdigest()
+
+
+def _record_key(request, key):
+    user_id = getattr(request.user, "pk", None)
+    scope = f"{user_id} {request.path} {key}"
+    return RECORD_KEY.format(hashlib.sha1(scope.encode()).hexdigest())
+
+
+def _replay(record, request_fingerprint):
+    if record["fingerprint"] != request_fingerprint:
+        metrics.incr("idempotency.mismatched")
+        return Response(
+            {"error": "Idempotency-Key was already used with a different request."},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    metrics.incr("idempotency.replayed")
+    response = Response(record["data"], status=record["status"])
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def _wait_for(record_key):
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_WAIT)
+        record = cache.get(record_key)
+        if record is not None:
+            return record
+        if cache.get(record_key + LOCK_SUFFIX) is None:
+            # The first attempt failed without leaving a response behind.
+            break
+    return None
+
+
+def idempotent(view):
+    # Goes below @api_view so it sees the DRF request and response.
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get("Idempotency-Key")
+        if key is None:
+            return view(request, *args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {"error": f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        request_fingerprint = fingerprint(request)
+        record_key = _record_key(request, key)
+        record = cache.get(record_key)
+        if record is not None:
+            return _replay(record, request_fingerprint)
+
+        lock = record_key + LOCK_SUFFIX
+        if not cache.add(lock, request_fingerprint, LOCK_TIMEOUT):
+            record = _wait_for(record_key)
+            if record is not None:
+                return _replay(record, request_fingerprint)
+            metrics.incr("idempotency.in_progress")
+            return Response(
+                {"error": "A request with this Idempotency-Key is in progress."},
+                status=status.HTTP_409_CONFLICT,
+            )
+
+        try:
+            response = view(request, *args, **kwargs)
+            # Server errors are worth retrying for real, everything else is
+            # the final answer for this key.
+            if isinstance(response, Response) and response.status_code < 500:
+                cache.set(
+                    record_key,
+                    {
+                        "fingerprint": request_fingerprint,
+                        "status": response.status_code,
+                        "data": response.data,
+                    },
+                    settings.IDEMPOTENCY_KEY_TTL,
+                )
+        finally:
+            cache.delete(lock)
+        return response
+
+    return wrapper
@@ -0,0 +1,64 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from khanadotcom_app.dispatch_optimizer import cost_matrix, haversine_matrix, solve
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulate a city of random orders and free drivers and compare "
+        "in-order dispatch with the optimal assignment. Nothing touches the "
+        "database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--orders", type=int, default=1000)
+        parser.add_argument("--drivers", type=int, default=1000)
+        parser.add_argument(
+            "--radius-km",
+            type=float,
+            default=15,
+            help="Half the side of the square the points are spread over.",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options["seed"])
+        # Centred on Ahmedabad; 1 degree of latitude is about 111 km.
+        spread = options["radius_km"] / 111.2
+        centre = np.array([23.0225, 72.5714])
+        orders = centre + rng.uniform(-spread, spread, (options["orders"], 2))
+        drivers = centre + rng.uniform(-spread, spread, (options["drivers"], 2))
+        ratings = np.round(rng.uniform(3, 5, options["drivers"]), 2)
+
+        started = time.perf_counter()
+        cost = cost_matrix(orders, drivers, ratings)
+        build = time.perf_counter() - started
+        started = time.perf_counter()
+        pairs = solve(cost)
+        elapsed = time.perf_counter() - started
+
+        # Compare on plain pickup distance; the rating bonus only steers the
+        # choice.
+        distance = haversine_matrix(
+            orders[:, 0], orders[:, 1], drivers[:, 0], drivers[:, 1]
+        )
+        count = min(options["orders"], options["drivers"])
+        rows = np.arange(count)
+        columns = np.array([column for _, column in pairs])
+        optimal_rows = np.array([row for row, _ in pairs])
+        self.stdout.write(
+            f"{options['orders']} orders x {options['drivers']} drivers: "
+            f"cost matrix {build * 1000:.1f} ms, solve {elapsed * 1000:.1f} ms"
+        )
+        self.report("in order", distance[rows, rows], ratings[rows])
+        self.report("optimal", distance[optimal_rows, columns], ratings[columns])
+
+    def report(self, name, distances, ratings):
+        self.stdout.write(
+            f"{name:>10}: {distances.sum():9.1f} km total, "
+            f"{distances.mean():5.2f} km per order, "
+            f"{ratings.mean():4.2f} average driver rating"
+        )
@@ -0,0 +1,79 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+
+from khanadotcom_app.catalog import build_menu_snapshot, menu_snapshot
+from khanadotcom_app.models import MenuItem, Restaurant
+
+
+def model_path(restaurant_id):
+    # What menu_items_api_by_restaurant used to do on every request: load
+    # MenuItem instances, build the dicts and render them.
+    menu_items = MenuItem.objects.filter(restaurant_id=restaurant_id)
+    data = [
+        {
+            "id": item.menu_item_id,
+            "name": item.name,
+            "restaurant": item.restaurant.name,
+            "restaurant_id": item.restaurant.restaurant_id,
+            "price": item.price,
+            "description": item.description,
+            "image": item.menu_item_pic.url if item.menu_item_pic else None,
+            "availability": item.availability,
+            "rating": item.rating,
+            "preparation_time": item.preparation_time,
+        }
+        for item in menu_items
+    ]
+    return JSONRenderer().render(data)
+
+
+def snapshot_path(restaurant_id):
+    return menu_snapshot(restaurant_id).body
+
+
+class Command(BaseCommand):
+    help = "Compare serving a restaurant menu from its snapshot with the ORM path."
+
+    def add_arguments(self, parser):
+        parser.add_argument("restaurant_id", nargs="?", type=int)
+        parser.add_argument("--iterations", type=int, default=200)
+
+    def handle(self, *args, **options):
+        restaurant_id = options["restaurant_id"]
+        if restaurant_id is None:
+            restaurant_id = (
+                MenuItem.objects.values_list("restaurant_id", flat=True)
+                .order_by("-restaurant_id")
+                .first()
+            )
+        if not Restaurant.objects.filter(pk=restaurant_id).exists():
+            raise CommandError("Restaurant not found.")
+
+        iterations = options["iterations"]
+        items = MenuItem.objects.filter(restaurant_id=restaurant_id).count()
+        self.stdout.write(
+            f"Restaurant {restaurant_id}: {items} menu items, "
+            f"{iterations} iterations"
+        )
+
+        self.report("orm", lambda: model_path(restaurant_id), iterations)
+        self.report(
+            "snapshot build", lambda: build_menu_snapshot(restaurant_id), iterations
+        )
+        self.report("snapshot", lambda: snapshot_path(restaurant_id), iterations)
+
+    def report(self, name, run, iterations):
+        run()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            for _ in range(iterations):
+                run()
+            elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"{name:>16}: {elapsed / iterations * 1000:8.3f} ms/request, "
+            f"{len(queries) / iterations:6.1f} queries/request"
+        )
@@ -0,0 +1,55 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from khanadotcom_app import dispatch, dispatch_optimizer
+
+
+class Command(BaseCommand):
+    help = "Assign confirmed orders to free delivery people in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0,
+            help="Keep running, one pass every INTERVAL seconds.",
+        )
+        parser.add_argument(
+            "--strategy",
+            choices=("optimal", "in-order"),
+            default="optimal",
+            help=(
+                "optimal: lowest total pickup distance over up to "
+                "DISPATCH_MAX_DRIVERS free drivers; in-order: oldest order "
+                "to the first free driver."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        if options["strategy"] == "optimal":
+            batch = {
+                "match": dispatch_optimizer.optimal_pairs,
+                "candidates": settings.DISPATCH_MAX_DRIVERS,
+            }
+        else:
+            batch = {"match": dispatch.pair_in_order}
+        while True:
+            started = time.perf_counter()
+            assigned = 0
+            # Drain the backlog before sleeping.
+            while True:
+                pairs = dispatch.assign_batch(limit=batch_size, **batch)
+                assigned += len(pairs)
+                if len(pairs) < batch_size:
+                    break
+            self.stdout.write(
+                f"assigned {assigned} orders in "
+                f"{(time.perf_counter() - started) * 1000:.1f} ms"
+            )
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
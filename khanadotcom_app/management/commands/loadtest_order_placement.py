@@ -0,0 +1,111 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.shortcuts import get_object_or_404
+from django.test.utils import CaptureQueriesContext
+
+from khanadotcom_app.models import MenuItem, Order, OrderItem, Payment, User
+from khanadotcom_app.orders import place_order
+
+
+def legacy_placement(user, restaurant_id, items):
+    # What order_placement_api used to do: one lookup and one INSERT per
+    # cart line, then an UPDATE for the total.
+    order = Order.objects.create(
+        user=user, delivery_address=user.address, total_amount=0
+    )
+    total_amount = 0
+    for item in items:
+        menu_item = get_object_or_404(MenuItem, pk=item["item_id"])
+        OrderItem.objects.create(
+            order=order,
+            menu_item=menu_item,
+            quantity=item["quantity"],
+            price=menu_item.price,
+        )
+        total_amount += menu_item.price * item["quantity"]
+    order.total_amount = total_amount
+    order.save()
+    Payment.objects.create(
+        order=order,
+        payment_method="cash_on_delivery",
+        amount=total_amount,
+        payment_status="pending",
+    )
+    return order
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Place orders in a loop with the old per-line path and the set-based "
+        "one and compare throughput. Everything is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("restaurant_id", nargs="?", type=int)
+        parser.add_argument("--orders", type=int, default=200)
+        parser.add_argument("--cart-size", type=int, default=15)
+        parser.add_argument("--user", help="Email of the ordering user.")
+
+    def handle(self, *args, **options):
+        restaurant_id = options["restaurant_id"]
+        if restaurant_id is None:
+            restaurant_id = (
+                MenuItem.objects.values_list("restaurant_id", flat=True)
+                .order_by("-restaurant_id")
+                .first()
+            )
+        menu_item_ids = list(
+            MenuItem.objects.filter(restaurant_id=restaurant_id, availability=True)
+            .order_by("pk")
+            .values_list("pk", flat=True)[: options["cart_size"]]
+        )
+        if not menu_item_ids:
+            raise CommandError("No available menu items for that restaurant.")
+        users = User.objects.all()
+        if options["user"]:
+            users = users.filter(email=options["user"])
+        user = users.order_by("pk").first()
+        if user is None:
+            raise CommandError("No user to place the orders with.")
+
+        items = [{"item_id": pk, "quantity": 2} for pk in menu_item_ids]
+        self.stdout.write(
+            f"Restaurant {restaurant_id}: {options['orders']} orders of "
+            f"{len(items)} lines"
+        )
+        legacy = self.report(
+            "per line",
+            lambda: legacy_placement(user, restaurant_id, items),
+            options["orders"],
+        )
+        bulk = self.report(
+            "set based",
+            lambda: place_order(user, restaurant_id, items),
+            options["orders"],
+        )
+        self.stdout.write(f"{'speedup':>10}: {bulk / legacy:.2f}x")
+
+    def report(self, name, place, orders):
+        try:
+            with transaction.atomic():
+                place()
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    for _ in range(orders):
+                        place()
+                    elapsed = time.perf_counter() - started
+                raise Rollback
+        except Rollback:
+            pass
+        throughput = orders / elapsed
+        self.stdout.write(
+            f"{name:>10}: {throughput:8.1f} orders/s, "
+            f"{len(queries) / orders:5.1f} queries/order"
+        )
+        return throughput
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from khanadotcom_app import catalog_cache, facets
+
+
+class Command(BaseCommand):
+    help = "Recompute the category facet counters from menu_item_category."
+
+    def handle(self, *args, **options):
+        facets.rebuild()
+        catalog_cache.bump("categories")
+        self.stdout.write(self.style.SUCCESS("Category counts rebuilt."))
@@ -0,0 +1,41 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from khanadotcom_app import outbox
+
+
+class Command(BaseCommand):
+    help = "Send the emails queued in the outbox."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=settings.OUTBOX_BATCH_SIZE
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=settings.OUTBOX_WORKERS,
+            help="Sending threads, each with its own mail connection.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0,
+            help="Keep running, one pass every INTERVAL seconds.",
+        )
+
+    def handle(self, *args, **options):
+        with outbox.Sender(options["workers"]) as sender:
+            while True:
+                started = time.perf_counter()
+                sent, failed = outbox.drain(sender, options["batch_size"])
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"sent {sent} emails, {failed} failed in {elapsed * 1000:.1f} ms"
+                    f" ({sent / elapsed if elapsed else 0:.1f}/s)"
+                )
+                if not options["interval"]:
+                    break
+                time.sleep(options["interval"])
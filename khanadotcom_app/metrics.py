@@ -0,0 +1,45 @@
+import threading
+from collections import defaultdict
+
+# Process-local counters for the performance features (compression, caches,
+# background workers). They are cheap enough to bump on every request and
+# are read through the staff-only /api/metrics/ endpoint. Each worker
+# process keeps its own numbers.
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+    def maximum(self, name, value):
+        with self._lock:
+            if value > self._counters.get(name, float("-inf")):
+                self._counters[name] = value
+
+    def get(self, name):
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def snapshot(self, prefix=""):
+        with self._lock:
+            return {
+                name: value
+                for name, value in sorted(self._counters.items())
+                if name.startswith(prefix)
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+
+
+metrics = Metrics()
+
+
+def ratio(numerator, denominator):
+    return round(numerator / denominator, 4) if denominator else None
@@ -1,31 +1,48 @@
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
 from rest_framework_simplejwt.exceptions import InvalidToken
 from django.http import HttpResponse
 
+from .authentication import CachedJWTAuthentication
+from .compression import PATH_PREFIX, compress_response
+from .public import is_public
+
+# Both middlewares run sync or async, whichever the rest of the stack is, so
+# under ASGI the async views (event streams, long-polls) stay on the event
+# loop instead of holding the single thread Django runs sync code in.
+
 
 class TokenMiddleware:
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self.authenticator = CachedJWTAuthentication()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.check(request)
+        if response is None:
+            response = self.get_response(request)
+        return response
+
+    async def __acall__(self, request):
+        response = await sync_to_async(self.check)(request)
+        if response is None:
+            response = await self.get_response(request)
+        return response
+
+    def check(self, request):
+        # Returns the error response for a request that may not go on, or
+        # None.
         token = request.headers.get("Authorization")
 
-        admin_paths = [
-            "/admin",
-            "/login/",
-            "/signup/",
-            "/delete-user/",
-            "/token/",
-            "/activate/",
-            "/password-reset/",
-            "/password-reset-confirm/",
-            "/contact/",
-            "/profile-owner/",
-            "/media/",
-            "/api/",
-        ]
-        if any(request.path.startswith(path) for path in admin_paths):
-            return self.get_response(request)
+        # Views marked @public, see public.py
+        if is_public(request.path_info):
+            return None
         if token:
             if not token.startswith("Bearer "):
                 return self.invalid_token_response(request)
@@ -33,13 +50,12 @@ class TokenMiddleware:
             token = token.split("Bearer ")[1].strip()
 
             try:
-                JWT_authenticator = JWTAuthentication()
-                response = JWT_authenticator.authenticate(request)
+                response = self.authenticator.authenticate(request)
                 if response:
                     UserData, token = response
                     request.UserData = UserData
                     request.token = token
-                    return self.get_response(request)
+                    return None
                 else:
                     return self.invalid_token_response(request)
             except InvalidToken:
@@ -58,3 +74,26 @@ class TokenMiddleware:
             content="Unauthorized: Token is missing",
             content_type="text/plain",
         )
+
+
+class CompressionMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.process(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.process(request, await self.get_response(request))
+
+    def process(self, request, response):
+        if request.path.startswith(PATH_PREFIX):
+            return compress_response(request, response)
+        return response
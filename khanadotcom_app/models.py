@@ -36,6 +36,12 @@ class User(AbstractUser):
     email = models.EmailField(unique=True)
     phone_number = models.CharField(max_length=15)
     address = models.TextField()
+    latitude = models.DecimalField(
+        max_digits=9, decimal_places=6, blank=True, null=True
+    )
+    longitude = models.DecimalField(
+        max_digits=9, decimal_places=6, blank=True, null=True
+    )
     access_token = models.TextField(blank=True, null=True)
     user_type = models.CharField(max_length=20, choices=USER_TYPES)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -105,6 +111,12 @@ class Restaurant(models.Model):
     owner = models.ForeignKey(RestaurantOwner, on_delete=models.CASCADE)
     name = models.CharField(max_length=500)
     address = models.TextField()
+    latitude = models.DecimalField(
+        max_digits=9, decimal_places=6, blank=True, null=True
+    )
+    longitude = models.DecimalField(
+        max_digits=9, decimal_places=6, blank=True, null=True
+    )
     phone_number = models.CharField(max_length=15)
     email = models.EmailField()
     profile_pic = models.ImageField(upload_to="restaurant_logo/", null=True, blank=True)
@@ -129,6 +141,12 @@ class DeliveryPerson(models.Model):
     vehicle_details = models.CharField(max_length=255, blank=True, null=True)
     availability_status = models.BooleanField(default=True)
     rating = models.DecimalField(max_digits=3, decimal_places=2, default=0.00)
+    latitude = models.DecimalField(
+        max_digits=9, decimal_places=6, blank=True, null=True
+    )
+    longitude = models.DecimalField(
+        max_digits=9, decimal_places=6, blank=True, null=True
+    )
     aadhaar_card_number = models.CharField(
         max_length=12, unique=True, blank=False, null=False
     )
@@ -180,7 +198,17 @@ class Order(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL, on_delete=models.CASCADE, default=1
     )
+    # Denormalised from the order items so a restaurant's queue is one
+    # index range scan.
+    restaurant = models.ForeignKey(
+        Restaurant, on_delete=models.SET_NULL, null=True, blank=True
+    )
+    # Amount payable, after the coupon discount.
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    coupon = models.ForeignKey(
+        "Coupon", on_delete=models.SET_NULL, null=True, blank=True
+    )
+    discount_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     order_status = models.CharField(
         max_length=20, choices=ORDER_STATUS_CHOICES, default="pending"
     )
@@ -198,22 +226,24 @@ class Order(models.Model):
         return f"Order {self.order_id} for {self.user.name}"
 
     def assign_delivery_person(self):
-        available_delivery_person = DeliveryPerson.objects.filter(
-            availability_status=True
-        ).first()
-        if available_delivery_person:
-            self.delivery_person = available_delivery_person
-            self.order_status = "out_for_delivery"
-            available_delivery_person.availability_status = False
-            available_delivery_person.save()
-            self.save()
-            return True
-        else:
+        from .dispatch import assign_order
+
+        driver_id = assign_order(self.pk)
+        if driver_id is None:
             return False
+        self.delivery_person_id = driver_id
+        self.order_status = "out_for_delivery"
+        return True
 
     class Meta:
         db_table = "order"
         managed = False
+        indexes = [
+            models.Index(
+                fields=["restaurant", "order_status", "created_at"],
+                name="order_restaurant_queue",
+            ),
+        ]
 
 
 class OrderItem(models.Model):
@@ -297,6 +327,7 @@ class Category(models.Model):
     category_id = models.AutoField(primary_key=True)
     name = models.CharField(max_length=255)
     description = models.TextField(blank=True, null=True)
+    item_count = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -323,6 +354,20 @@ class MenuItemCategory(models.Model):
         managed = False
 
 
+class RestaurantCategoryCount(models.Model):
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+    item_count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.restaurant_id} - {self.category_id}: {self.item_count}"
+
+    class Meta:
+        db_table = "restaurant_category_count"
+        managed = False
+        unique_together = ("restaurant", "category")
+
+
 class Notification(models.Model):
     notification_id = models.AutoField(primary_key=True)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -464,10 +509,16 @@ class EmailsLogs(models.Model):
     )
     is_update = models.IntegerField(blank=True, null=True)
     is_smtp = models.BooleanField(default=False)
+    attempts = models.IntegerField(default=0)
 
     class Meta:
         db_table = "email_log"
         managed = False
+        indexes = [
+            models.Index(
+                fields=["is_sent", "to_be_sent_date"], name="email_log_outbox"
+            ),
+        ]
 
 
 class ContactMessage(models.Model):
@@ -0,0 +1,112 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from . import events
+from .metrics import metrics
+from .models import Order
+
+# Order status state machine.
+#
+# Every status change is one conditional UPDATE:
+#
+#   UPDATE order SET order_status = <target>, ...
+#   WHERE order_id = <id> AND order_status IN (<statuses allowed to move there>)
+#
+# and the affected row count says whether it won. Two actors racing on the
+# same order (owner confirming while the customer cancels, two drivers
+# grabbing it) can never both succeed or overwrite each other's columns.
+# Successful changes are written through to the status cache and published
+# to the order's event stream on commit.
+
+STATUS_KEY = "order-status:{}"
+
+STATUSES = tuple(status for status, _ in Order.ORDER_STATUS_CHOICES)
+
+TRANSITIONS = {
+    "pending": ("confirmed", "cancelled"),
+    "confirmed": ("preparing", "out_for_delivery", "cancelled"),
+    "preparing": ("out_for_delivery", "cancelled"),
+    "out_for_delivery": ("delivered",),
+    "delivered": (),
+    "cancelled": (),
+}
+
+
+class InvalidTransition(ValueError):
+    def __init__(self, order_id, current, target):
+        self.order_id = order_id
+        self.current = current
+        self.target = target
+        super().__init__(f"Order {order_id} cannot move from {current} to {target}.")
+
+
+def sources_of(target):
+    return tuple(status for status in STATUSES if target in TRANSITIONS[status])
+
+
+def _status_record(order_id, order_status, updated_at):
+    return {"order_id": order_id, "status": order_status, "updated_at": updated_at}
+
+
+def current_status(order_id):
+    # {order_id, status, updated_at} for status polling, or None when there
+    # is no such order. Served from the write-through cache; a miss costs
+    # one SELECT of three columns by primary key.
+    key = STATUS_KEY.format(order_id)
+    record = cache.get(key)
+    if record is not None:
+        metrics.incr("order_status.cache_hits")
+        return record
+    metrics.incr("order_status.cache_misses")
+    row = (
+        Order.objects.filter(pk=order_id)
+        .values_list("order_status", "updated_at")
+        .first()
+    )
+    if row is None:
+        return None
+    record = _status_record(order_id, *row)
+    # add, not set: a transition committing meanwhile has the newer value.
+    cache.add(key, record, settings.ORDER_STATUS_CACHE_TTL)
+    return record
+
+
+def status_changed(order_id, order_status, updated_at):
+    # Runs once the change is committed.
+    cache.set(
+        STATUS_KEY.format(order_id),
+        _status_record(order_id, order_status, updated_at),
+        settings.ORDER_STATUS_CACHE_TTL,
+    )
+    events.publish_order_status(order_id, order_status, updated_at)
+
+
+def transition(order_id, target, expected=None, **changes):
+    # Moves the order to ``target`` and applies ``changes`` to the same row
+    # in the same statement. ``expected`` pins the status the caller saw;
+    # otherwise any status allowed to move to ``target`` will do. Raises
+    # Order.DoesNotExist or InvalidTransition when the UPDATE matches nothing.
+    if target not in TRANSITIONS:
+        raise ValueError(f"Unknown order status: {target}.")
+    sources = sources_of(target)
+    if expected is not None:
+        if expected not in sources:
+            raise InvalidTransition(order_id, expected, target)
+        sources = (expected,)
+
+    now = timezone.now()
+    updated = Order.objects.filter(pk=order_id, order_status__in=sources).update(
+        order_status=target, updated_at=now, **changes
+    )
+    if updated:
+        transaction.on_commit(lambda: status_changed(order_id, target, now))
+        return target
+
+    current = (
+        Order.objects.filter(pk=order_id).values_list("order_status", flat=True).first()
+    )
+    if current is None:
+        raise Order.DoesNotExist(f"Order {order_id} does not exist.")
+    raise InvalidTransition(order_id, current, target)
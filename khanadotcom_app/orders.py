@@ -0,0 +1,105 @@
+from django.db import transaction
+from django.http import Http404
+
+from . import events
+from .coupons import coupon_index, discount_for, redeemed
+from .models import MenuItem, Order, OrderItem, Payment, Restaurant
+
+# Order placement. The whole cart is resolved with one in_bulk lookup and
+# written with one bulk INSERT, together with the order and payment rows in
+# a single transaction, so placing an order costs the same handful of round
+# trips whatever the size of the cart. Coupons come from the in-process
+# coupon index and add no round trip either.
+
+MENU_ITEM_ORDER_COLUMNS = (
+    "menu_item_id",
+    "restaurant_id",
+    "name",
+    "price",
+    "availability",
+)
+
+
+def parse_cart(items):
+    # Returns {menu_item_id: quantity}; repeated lines are merged.
+    if not items or not isinstance(items, list):
+        raise ValueError("items are required fields.")
+    cart = {}
+    for item in items:
+        try:
+            menu_item_id = int(item["item_id"])
+            quantity = int(item["quantity"])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("Every item needs an integer 'item_id' and 'quantity'.")
+        if quantity < 1:
+            raise ValueError("quantity must be a positive integer.")
+        cart[menu_item_id] = cart.get(menu_item_id, 0) + quantity
+    return cart
+
+
+def resolve_cart(restaurant_id, cart):
+    # Returns [(menu_item, quantity)] after checking every item exists,
+    # belongs to the restaurant and can be ordered right now.
+    menu_items = MenuItem.objects.only(*MENU_ITEM_ORDER_COLUMNS).in_bulk(cart)
+    missing = sorted(set(cart) - set(menu_items))
+    if missing:
+        raise Http404("Menu item(s) not found: " + ", ".join(map(str, missing)) + ".")
+    foreign = [
+        item.name for item in menu_items.values() if item.restaurant_id != restaurant_id
+    ]
+    if foreign:
+        raise ValueError(
+            "Not on this restaurant's menu: " + ", ".join(sorted(foreign)) + "."
+        )
+    unavailable = [item.name for item in menu_items.values() if not item.availability]
+    if unavailable:
+        raise ValueError(
+            "Currently unavailable: " + ", ".join(sorted(unavailable)) + "."
+        )
+    return [
+        (menu_items[menu_item_id], quantity) for menu_item_id, quantity in cart.items()
+    ]
+
+
+def place_order(
+    user, restaurant_id, items, payment_method="cash_on_delivery", coupon_code=None
+):
+    cart = parse_cart(items)
+    if not Restaurant.objects.filter(pk=restaurant_id).exists():
+        raise Http404("No Restaurant matches the given query.")
+    lines = resolve_cart(restaurant_id, cart)
+    total_amount = sum(menu_item.price * quantity for menu_item, quantity in lines)
+    coupon, discount_amount = None, 0
+    if coupon_code:
+        coupon = coupon_index.lookup(coupon_code)
+        discount_amount = discount_for(coupon, total_amount)
+        total_amount -= discount_amount
+
+    with transaction.atomic():
+        order = Order.objects.create(
+            user=user,
+            restaurant_id=restaurant_id,
+            delivery_address=user.address,
+            total_amount=total_amount,
+            coupon_id=coupon.coupon_id if coupon else None,
+            discount_amount=discount_amount,
+        )
+        OrderItem.objects.bulk_create(
+            OrderItem(
+                order=order,
+                menu_item=menu_item,
+                quantity=quantity,
+                price=menu_item.price,
+            )
+            for menu_item, quantity in lines
+        )
+        Payment.objects.create(
+            order=order,
+            payment_method=payment_method,
+            amount=total_amount,
+            payment_status="pending",  # Adjust based on actual payment flow
+        )
+        transaction.on_commit(lambda: events.publish_new_order(restaurant_id, order))
+        if coupon is not None:
+            transaction.on_commit(lambda: redeemed(coupon.coupon_id))
+    return order
@@ -0,0 +1,194 @@
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .metrics import metrics, ratio
+from .models import EmailsLogs
+
+# Outgoing email.
+#
+# Views only add a row to email_log (EmailsLogs) with is_sent=PENDING and
+# to_be_sent_date set, so a request never waits on an SMTP handshake. The
+# send_outbox command drains the table: a batch of due rows is claimed with
+# SELECT ... FOR UPDATE SKIP LOCKED and pushed OUTBOX_CLAIM_SECONDS into the
+# future, so parallel workers never pick the same rows, and a worker that
+# dies mid-batch only delays its rows. The batch is then sent by a thread
+# pool in which every thread keeps one mail connection open across batches,
+# and the sent rows are marked with a single update. Failed sends are retried
+# with exponential backoff until OUTBOX_MAX_ATTEMPTS.
+#
+# Rows logged before the outbox existed have no to_be_sent_date and are
+# never picked up.
+
+PENDING = 0
+SENT = 1
+FAILED = 2
+
+
+def enqueue(subject, message, recipient, added_by, request=None, is_otp=0):
+    now = timezone.now()
+    email = EmailsLogs.objects.create(
+        subject=subject,
+        message=message,
+        recipient=recipient,
+        added_by=added_by,
+        is_otp=is_otp,
+        is_sent=PENDING,
+        sent_date=now,
+        to_be_sent_date=now,
+        ip_address=(request and request.META.get("REMOTE_ADDR")) or "0.0.0.0",
+    )
+    metrics.incr("outbox.enqueued")
+    return email
+
+
+def claim(limit, now=None):
+    now = now or timezone.now()
+    with transaction.atomic():
+        emails = list(
+            EmailsLogs.objects.select_for_update(skip_locked=True)
+            .filter(is_sent=PENDING, is_deleted=False, to_be_sent_date__lte=now)
+            .order_by("to_be_sent_date")
+            .only("pk", "subject", "message", "recipient", "attempts")[:limit]
+        )
+        EmailsLogs.objects.filter(pk__in=[email.pk for email in emails]).update(
+            to_be_sent_date=now + timedelta(seconds=settings.OUTBOX_CLAIM_SECONDS)
+        )
+    return emails
+
+
+def backoff(attempts):
+    # Seconds before the next try of a message that failed ``attempts`` times.
+    return settings.OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+
+
+class Sender:
+    # Sends claimed rows on a pool of ``workers`` threads. Use as a context
+    # manager; the connections are closed on exit.
+
+    def __init__(self, workers):
+        self.workers = workers
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix="outbox")
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._pool.shutdown()
+        for connection in self._connections:
+            connection.close()
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = get_connection(fail_silently=False)
+            connection.open()
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+            metrics.incr("outbox.connections")
+        return connection
+
+    def _drop_connection(self):
+        connection = self._local.__dict__.pop("connection", None)
+        if connection is not None:
+            with self._lock:
+                self._connections.remove(connection)
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def _send(self, message):
+        try:
+            self._connection().send_messages([message])
+        except smtplib.SMTPServerDisconnected:
+            # The server dropped a connection we kept open, e.g. after an
+            # idle timeout. That is not the message's fault, so it gets one
+            # more try on a fresh connection before it counts as failed.
+            self._drop_connection()
+            metrics.incr("outbox.reconnects")
+            self._connection().send_messages([message])
+
+    def _send_chunk(self, emails):
+        # Returns the ids sent and the emails that failed.
+        sent, failed = [], []
+        for email in emails:
+            message = EmailMessage(email.subject, email.message, to=[email.recipient])
+            try:
+                self._send(message)
+            except Exception:
+                # The next message gets a fresh connection.
+                self._drop_connection()
+                failed.append(email)
+            else:
+                sent.append(email.pk)
+        return sent, failed
+
+    def send(self, emails):
+        chunks = [emails[i :: self.workers] for i in range(self.workers)]
+        sent, failed = [], []
+        for chunk_sent, chunk_failed in self._pool.map(self._send_chunk, chunks):
+            sent += chunk_sent
+            failed += chunk_failed
+        return sent, failed
+
+
+def record(sent, failed, now=None):
+    now = now or timezone.now()
+    if sent:
+        EmailsLogs.objects.filter(pk__in=sent).update(
+            is_sent=SENT, sent_date=now, attempts=F("attempts") + 1
+        )
+    for email in failed:
+        attempts = email.attempts + 1
+        if attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+            changes = {"is_sent": FAILED}
+            metrics.incr("outbox.failed")
+        else:
+            changes = {"to_be_sent_date": now + timedelta(seconds=backoff(attempts))}
+            metrics.incr("outbox.retried")
+        EmailsLogs.objects.filter(pk=email.pk).update(attempts=attempts, **changes)
+    metrics.incr("outbox.sent", len(sent))
+
+
+def drain(sender, batch_size):
+    # Sends due emails until none are left. Returns (sent, failed).
+    started = time.perf_counter()
+    total_sent = total_failed = 0
+    while True:
+        emails = claim(batch_size)
+        if not emails:
+            break
+        sent, failed = sender.send(emails)
+        record(sent, failed)
+        total_sent += len(sent)
+        total_failed += len(failed)
+        if len(emails) < batch_size:
+            break
+    metrics.incr("outbox.seconds", time.perf_counter() - started)
+    return total_sent, total_failed
+
+
+def report():
+    sent = metrics.get("outbox.sent")
+    return {
+        "enqueued": int(metrics.get("outbox.enqueued")),
+        "sent": int(sent),
+        "retried": int(metrics.get("outbox.retried")),
+        "failed": int(metrics.get("outbox.failed")),
+        "connections": int(metrics.get("outbox.connections")),
+        "reconnects": int(metrics.get("outbox.reconnects")),
+        "per_second": ratio(sent, metrics.get("outbox.seconds")),
+    }
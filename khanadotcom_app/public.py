@@ -0,0 +1,60 @@
+import functools
+import re
+
+from django.urls import URLResolver, get_resolver
+
+# Routes that need no bearer token.
+#
+# Views opt out of TokenMiddleware with @public, and whole URLconfs (the
+# admin, media files) with public_routes() where they are included. On first
+# use the marked routes are compiled from the URLconf into one regex, so the
+# middleware decides whether a path needs a token with a single match, and a
+# public view is declared next to its code instead of in a list kept by hand.
+
+NAMED_GROUP = re.compile(r"\(\?P<\w+>")
+NEVER = re.compile(r"(?!)")
+
+
+def public(view):
+    view.public = True
+    return view
+
+
+def public_routes(*patterns):
+    # Marks URL patterns, or included URLconfs as a whole, as public.
+    for pattern in patterns:
+        pattern.public = True
+    return list(patterns)
+
+
+def _route_regex(pattern):
+    regex = pattern.pattern.regex.pattern.removeprefix("^")
+    # Group names repeat across routes and may not in one regex.
+    return NAMED_GROUP.sub("(?:", regex)
+
+
+def _public_regexes(patterns, prefix=""):
+    for pattern in patterns:
+        regex = prefix + _route_regex(pattern)
+        if getattr(pattern, "public", False):
+            if isinstance(pattern, URLResolver) and regex.endswith("/"):
+                # Lets "/admin" through to its redirect to "/admin/".
+                regex = regex[:-1] + r"(?:/|\Z)"
+            yield regex
+        elif isinstance(pattern, URLResolver):
+            yield from _public_regexes(pattern.url_patterns, regex)
+        elif getattr(pattern.callback, "public", False):
+            yield regex
+
+
+@functools.lru_cache(maxsize=None)
+def _compile(resolver):
+    regexes = list(_public_regexes(resolver.url_patterns))
+    if not regexes:
+        return NEVER
+    return re.compile("/(?:{})".format("|".join(regexes)))
+
+
+def is_public(path):
+    # get_resolver() is cached too, and changes when ROOT_URLCONF does.
+    return _compile(get_resolver()).match(path) is not None
@@ -0,0 +1,430 @@
+import bisect
+import heapq
+import math
+import re
+import threading
+from collections import OrderedDict, defaultdict, namedtuple
+from datetime import timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from . import catalog_cache
+from .catalog import MENU_ITEM_IMAGE, RESTAURANT_IMAGE, media_url
+from .models import MenuItem, MenuItemCategory, Restaurant
+
+# In-process inverted index over dishes and restaurants.
+#
+# Every document (a menu item or a restaurant) is tokenised once when it is
+# indexed and the postings map each token to the documents containing it,
+# weighted by the field it came from. A query intersects the postings of its
+# tokens, smallest list first, so it touches only matching documents and
+# never the database. The last query token also matches as a prefix, which
+# keeps as-you-type lookups useful.
+#
+# The writing process updates its index from model signals. Other worker
+# processes notice the shared "search" version moved and catch up on the
+# rows whose updated_at is newer than their last sync. Removing a category
+# link touches its menu item, see signals.py, and deleted rows are found by
+# looking up the indexed ids.
+
+TOKEN_RE = re.compile(r"\w+")
+MIN_TOKEN_LENGTH = 2
+MAX_PREFIX_EXPANSION = 50
+# Below this many candidates a query scores every one of them directly.
+DIRECT_SCAN_LIMIT = 2000
+RESULT_CACHE_SIZE = 1024
+# How much a 5-star rating lifts the text relevance of a hit.
+RATING_BOOST = 0.5
+SYNC_OVERLAP = timedelta(seconds=2)
+# Indexed ids checked per query when sync looks for deleted rows.
+SYNC_BATCH_SIZE = 500
+
+MENU_ITEM_WEIGHTS = {
+    "name": 3.0,
+    "restaurant": 1.5,
+    "category": 2.0,
+    "description": 1.0,
+}
+RESTAURANT_WEIGHTS = {"name": 3.0}
+
+
+def tokenize(text):
+    if not text:
+        return []
+    return [
+        token
+        for token in TOKEN_RE.findall(text.lower())
+        if len(token) >= MIN_TOKEN_LENGTH
+    ]
+
+
+def weigh_fields(fields, weights):
+    token_weights = defaultdict(float)
+    for field, texts in fields.items():
+        for text in texts:
+            for token in tokenize(text):
+                token_weights[token] = max(token_weights[token], weights[field])
+    return token_weights
+
+
+# One query token resolved against the index: the indexed tokens it covers
+# (several for a prefix), their postings, a doc_id -> weight lookup and the
+# token's idf.
+Term = namedtuple("Term", "tokens postings weight idf")
+
+
+class SearchIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings = defaultdict(dict)  # token -> {doc_id: weight}
+        self._ranked = {}  # token -> [(-weight * boost, doc_id)], built lazily
+        self._doc_tokens = {}  # doc_id -> {token: weight}
+        self._docs = {}  # doc_id -> result payload
+        self._boost = {}  # doc_id -> rating multiplier
+        self._vocabulary = []
+        self._vocabulary_dirty = False
+        # Recent answers, dropped whenever the index changes. Catalog writes
+        # are rare next to searches and popular queries repeat a lot.
+        self._results = OrderedDict()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def ids(self):
+        with self._lock:
+            return set(self._docs)
+
+    def add(self, doc_id, payload, token_weights):
+        with self._lock:
+            self.remove(doc_id)
+            self._results.clear()
+            self._docs[doc_id] = payload
+            self._boost[doc_id] = 1 + RATING_BOOST * payload["rating"] / 5
+            self._doc_tokens[doc_id] = token_weights
+            for token, weight in token_weights.items():
+                postings = self._postings[token]
+                if not postings:
+                    self._vocabulary_dirty = True
+                postings[doc_id] = weight
+                self._ranked.pop(token, None)
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._results.clear()
+            self._docs.pop(doc_id, None)
+            self._boost.pop(doc_id, None)
+            for token in self._doc_tokens.pop(doc_id, ()):
+                postings = self._postings[token]
+                postings.pop(doc_id, None)
+                self._ranked.pop(token, None)
+                if not postings:
+                    del self._postings[token]
+                    self._vocabulary_dirty = True
+
+    def _expand(self, token, prefix):
+        if not prefix:
+            return [token] if token in self._postings else []
+        if self._vocabulary_dirty:
+            self._vocabulary = sorted(self._postings)
+            self._vocabulary_dirty = False
+        start = bisect.bisect_left(self._vocabulary, token)
+        matches = []
+        for candidate in self._vocabulary[start : start + MAX_PREFIX_EXPANSION]:
+            if not candidate.startswith(token):
+                break
+            matches.append(candidate)
+        return matches
+
+    def _ranked_postings(self, token):
+        # Postings ordered by their best possible contribution, so a query
+        # can stop reading as soon as nothing further down can make the top.
+        ranked = self._ranked.get(token)
+        if ranked is None:
+            boost = self._boost
+            ranked = sorted(
+                (-weight * boost[doc_id], doc_id)
+                for doc_id, weight in self._postings[token].items()
+            )
+            self._ranked[token] = ranked
+        return ranked
+
+    def _term(self, token, prefix, total):
+        expanded = self._expand(token, prefix)
+        if not expanded:
+            return None
+        postings = [self._postings[candidate] for candidate in expanded]
+        frequency = sum(map(len, postings))
+        if len(postings) > 1 and frequency <= DIRECT_SCAN_LIMIT:
+            merged = {}
+            for p in postings:
+                for doc_id, weight in p.items():
+                    if weight > merged.get(doc_id, 0.0):
+                        merged[doc_id] = weight
+            postings = [merged]
+        if len(postings) == 1:
+            weight = postings[0].get
+        else:
+
+            def weight(doc_id, default=None):
+                return max((p.get(doc_id, 0.0) for p in postings)) or default
+
+        return Term(expanded, postings, weight, math.log(1 + total / frequency))
+
+    def search(self, query, limit=20):
+        tokens = tuple(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return []
+        with self._lock:
+            key = (tokens, limit)
+            hits = self._results.get(key)
+            if hits is None:
+                hits = self._search(tokens, limit)
+                self._results[key] = hits
+                if len(self._results) > RESULT_CACHE_SIZE:
+                    self._results.popitem(last=False)
+            else:
+                self._results.move_to_end(key)
+            return [dict(hit) for hit in hits]
+
+    def _search(self, tokens, limit):
+        total = len(self._docs) or 1
+        terms = []
+        for position, token in enumerate(tokens):
+            term = self._term(token, position == len(tokens) - 1, total)
+            if term is None:
+                return []
+            terms.append(term)
+        # Rarest term first: fewest candidates and earliest rejections.
+        terms.sort(key=lambda term: term.idf, reverse=True)
+        if sum(map(len, terms[0].postings)) <= DIRECT_SCAN_LIMIT:
+            return self._scan(terms, limit)
+        return self._top(terms, limit)
+
+    def _score(self, doc_id, terms):
+        score = 0.0
+        for term in terms:
+            weight = term.weight(doc_id)
+            if weight is None:
+                return None
+            score += weight * term.idf
+        return score * self._boost[doc_id]
+
+    def _scan(self, terms, limit):
+        # A rare term bounds the candidates, scoring all of them is cheaper
+        # than walking the ranked postings of the common ones.
+        candidates = set().union(*terms[0].postings)
+        hits = []
+        for doc_id in candidates:
+            score = self._score(doc_id, terms)
+            if score is not None:
+                hits.append((score, doc_id))
+        return self._payloads(heapq.nlargest(limit, hits))
+
+    def _top(self, terms, limit):
+        # Fagin's threshold algorithm: read every term's ranked postings in
+        # lockstep, score each newly seen document completely via the
+        # postings dicts, and stop once the k-th best score beats the best
+        # score any unseen document could still reach.
+        streams = [
+            heapq.merge(*map(self._ranked_postings, term.tokens)) for term in terms
+        ]
+        best = []  # min-heap of (score, doc_id)
+        seen = set()
+        # When the terms rarely co-occur the walk gets deep; past the size of
+        # the rarest postings a plain scan of those is the cheaper plan.
+        budget = sum(map(len, terms[0].postings))
+        frontier = [0.0] * len(terms)
+        while True:
+            for position, stream in enumerate(streams):
+                entry = next(stream, None)
+                if entry is None:
+                    # Every hit contains every term, so once one term's
+                    # postings are exhausted all hits have been scored.
+                    return self._payloads(best)
+                contribution, doc_id = entry
+                frontier[position] = -contribution * terms[position].idf
+                if doc_id in seen:
+                    continue
+                seen.add(doc_id)
+                if len(seen) > budget:
+                    return self._scan(terms, limit)
+                score = self._score(doc_id, terms)
+                if score is not None:
+                    hit = (score, doc_id)
+                    if len(best) < limit:
+                        heapq.heappush(best, hit)
+                    elif hit > best[0]:
+                        heapq.heapreplace(best, hit)
+            if len(best) == limit and best[0][0] >= sum(frontier):
+                return self._payloads(best)
+
+    def _payloads(self, best):
+        return [
+            dict(self._docs[doc_id], score=round(score, 4))
+            for score, doc_id in sorted(best, reverse=True)
+        ]
+
+
+def menu_item_document(row, categories):
+    payload = {
+        "type": "menu_item",
+        "id": row["menu_item_id"],
+        "name": row["name"],
+        "restaurant": row["restaurant__name"],
+        "restaurant_id": row["restaurant_id"],
+        "price": row["price"],
+        "image": media_url(MENU_ITEM_IMAGE, row["menu_item_pic"]),
+        "rating": float(row["rating"]),
+    }
+    fields = {
+        "name": [row["name"]],
+        "restaurant": [row["restaurant__name"]],
+        "category": categories,
+        "description": [row["description"]],
+    }
+    return payload, weigh_fields(fields, MENU_ITEM_WEIGHTS)
+
+
+def restaurant_document(row):
+    payload = {
+        "type": "restaurant",
+        "id": row["restaurant_id"],
+        "name": row["name"],
+        "image": media_url(RESTAURANT_IMAGE, row["profile_pic"]),
+        "rating": float(row["rating"]),
+    }
+    return payload, weigh_fields({"name": [row["name"]]}, RESTAURANT_WEIGHTS)
+
+
+MENU_ITEM_SEARCH_COLUMNS = (
+    "menu_item_id",
+    "name",
+    "description",
+    "price",
+    "menu_item_pic",
+    "rating",
+    "restaurant_id",
+    "restaurant__name",
+)
+RESTAURANT_SEARCH_COLUMNS = ("restaurant_id", "name", "profile_pic", "rating")
+
+
+class CatalogSearch:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.indexes = None
+        self._version = None
+        self._synced_at = None
+
+    def _index_menu_items(self, menu_items):
+        rows = list(menu_items.values(*MENU_ITEM_SEARCH_COLUMNS))
+        categories = defaultdict(list)
+        for menu_item_id, name in MenuItemCategory.objects.filter(
+            menu_item__in=menu_items.values("pk")
+        ).values_list("menu_item_id", "category__name"):
+            categories[menu_item_id].append(name)
+        index = self.indexes["menu_item"]
+        for row in rows:
+            index.add(
+                row["menu_item_id"],
+                *menu_item_document(row, categories[row["menu_item_id"]]),
+            )
+
+    def _index_restaurants(self, restaurants):
+        index = self.indexes["restaurant"]
+        for row in restaurants.values(*RESTAURANT_SEARCH_COLUMNS):
+            index.add(row["restaurant_id"], *restaurant_document(row))
+
+    def build(self):
+        version = catalog_cache.scope_version("search")
+        synced_at = timezone.now()
+        self.indexes = {"menu_item": SearchIndex(), "restaurant": SearchIndex()}
+        self._index_restaurants(Restaurant.objects.all())
+        self._index_menu_items(MenuItem.objects.all())
+        self._version, self._synced_at = version, synced_at
+
+    def sync(self):
+        # Catch up on writes committed by other processes since our last
+        # build or sync.
+        version = catalog_cache.scope_version("search")
+        if version == self._version:
+            return
+        since = self._synced_at - SYNC_OVERLAP
+        synced_at = timezone.now()
+        restaurant_ids = set(
+            Restaurant.objects.filter(updated_at__gte=since).values_list(
+                "pk", flat=True
+            )
+        )
+        self._index_restaurants(Restaurant.objects.filter(pk__in=restaurant_ids))
+        self._index_menu_items(
+            MenuItem.objects.filter(
+                Q(updated_at__gte=since)
+                | Q(restaurant_id__in=restaurant_ids)
+                | Q(menuitemcategory__updated_at__gte=since)
+                | Q(menuitemcategory__category__updated_at__gte=since)
+            ).distinct()
+        )
+        # Deletes leave no row to notice by updated_at.
+        for doc_type, model in (("restaurant", Restaurant), ("menu_item", MenuItem)):
+            index = self.indexes[doc_type]
+            indexed = sorted(index.ids())
+            for start in range(0, len(indexed), SYNC_BATCH_SIZE):
+                batch = indexed[start : start + SYNC_BATCH_SIZE]
+                present = set(
+                    model.objects.filter(pk__in=batch).values_list("pk", flat=True)
+                )
+                for doc_id in set(batch) - present:
+                    index.remove(doc_id)
+        self._version, self._synced_at = version, synced_at
+
+    def search(self, query, limit=20, doc_type=None):
+        with self._lock:
+            if self.indexes is None:
+                self.build()
+            else:
+                self.sync()
+        if doc_type:
+            return self.indexes[doc_type].search(query, limit=limit)
+        hits = [
+            hit
+            for index in self.indexes.values()
+            for hit in index.search(query, limit=limit)
+        ]
+        return heapq.nlargest(limit, hits, key=lambda hit: hit["score"])
+
+    # Signal hooks. They tell the other processes to sync and, when this
+    # index exists, apply the change locally. The first build reads the
+    # committed rows anyway.
+
+    def _applied(self):
+        (version,) = catalog_cache.bump("search")
+        # Skip our own sync for this write unless we had already fallen
+        # behind someone else's.
+        if self._version == version - 1:
+            self._version = version
+
+    def menu_items_changed(self, menu_items):
+        if self.indexes is not None:
+            self._index_menu_items(menu_items)
+        self._applied()
+
+    def menu_item_deleted(self, menu_item_id):
+        if self.indexes is not None:
+            self.indexes["menu_item"].remove(menu_item_id)
+        self._applied()
+
+    def restaurant_changed(self, restaurant_id):
+        if self.indexes is not None:
+            self._index_restaurants(Restaurant.objects.filter(pk=restaurant_id))
+            self._index_menu_items(MenuItem.objects.filter(restaurant_id=restaurant_id))
+        self._applied()
+
+    def restaurant_deleted(self, restaurant_id):
+        if self.indexes is not None:
+            self.indexes["restaurant"].remove(restaurant_id)
+        self._applied()
+
+
+catalog_search = CatalogSearch()
@@ -10,17 +10,35 @@ from .models import (
 )
 
 
+class SparseFieldsMixin:
+    # Takes an optional ``fields`` argument naming the subset of
+    # ``Meta.fields`` to render, see fieldsets.requested_fields.
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop("fields", None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
 class OrderItemSerializer(serializers.ModelSerializer):
+    menu_item_name = serializers.CharField(source="menu_item.name", read_only=True)
+    menu_item_image = serializers.ImageField(
+        source="menu_item.menu_item_pic", read_only=True
+    )
+
     class Meta:
         model = OrderItem
         fields = (
             "menu_item",
+            "menu_item_name",
+            "menu_item_image",
             "quantity",
             "price",
         )  # Adjust fields as per your OrderItem model
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     items = OrderItemSerializer(source="orderitem_set", many=True, read_only=True)
 
     class Meta:
@@ -35,6 +53,11 @@ class OrderSerializer(serializers.ModelSerializer):
         )
 
 
+class RestaurantOrderSerializer(OrderSerializer):
+    class Meta(OrderSerializer.Meta):
+        fields = OrderSerializer.Meta.fields + ("order_status", "created_at")
+
+
 class CustomerDetailSerializer(serializers.ModelSerializer):
     class Meta:
         model = CustomerDetail
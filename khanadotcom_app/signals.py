@@ -0,0 +1,159 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import catalog_cache, facets
+from .authentication import user_changed
+from .catalog import menu_snapshot
+from .coupons import coupon_index
+from .geo import nearby_restaurants
+from .models import Category, Coupon, MenuItem, MenuItemCategory, Restaurant, User
+from .search import catalog_search
+
+# Catalog cache invalidation, menu snapshot rebuilds and search / nearby /
+# coupon index maintenance. Everything runs once the write commits, so a
+# reader can never cache the pre-commit rows under the new version and a
+# rolled back write never reaches the snapshots or the index.
+#
+# The category facet counters are the exception: they are plain columns and
+# move inside the writing transaction, see facets.py.
+
+
+@receiver(post_save, sender=Restaurant)
+@receiver(post_delete, sender=Restaurant)
+def restaurant_changed(sender, instance, **kwargs):
+    restaurant_id = instance.restaurant_id
+    deleted = kwargs["signal"] is post_delete
+
+    def on_commit():
+        catalog_cache.bump(
+            "restaurants",
+            "menu",
+            f"restaurant:{restaurant_id}",
+            f"menu:{restaurant_id}",
+        )
+        if deleted:
+            catalog_search.restaurant_deleted(restaurant_id)
+            nearby_restaurants.restaurant_deleted(restaurant_id)
+        else:
+            menu_snapshot(restaurant_id)
+            catalog_search.restaurant_changed(restaurant_id)
+            nearby_restaurants.restaurant_changed(restaurant_id)
+
+    transaction.on_commit(on_commit)
+
+
+@receiver(post_init, sender=MenuItem)
+def remember_menu_item(sender, instance, **kwargs):
+    # Loaded values, to tell on save whether the item changed restaurants.
+    # Read from __dict__ so deferred fields are not fetched.
+    instance._loaded_restaurant_id = instance.__dict__.get("restaurant_id")
+
+
+@receiver(post_save, sender=MenuItem)
+@receiver(post_delete, sender=MenuItem)
+def menu_item_changed(sender, instance, **kwargs):
+    menu_item_id = instance.menu_item_id
+    restaurant_id = instance.restaurant_id
+    deleted = kwargs["signal"] is post_delete
+    moved_from = None
+    if not deleted and not kwargs["created"]:
+        moved_from = instance._loaded_restaurant_id
+        if moved_from not in (None, restaurant_id):
+            facets.menu_item_moved(menu_item_id, moved_from, restaurant_id)
+        else:
+            moved_from = None
+    instance._loaded_restaurant_id = restaurant_id
+
+    def on_commit():
+        catalog_cache.bump("menu", f"menu:{restaurant_id}")
+        menu_snapshot(restaurant_id)
+        if moved_from is not None:
+            catalog_cache.bump(f"menu:{moved_from}", "categories")
+            menu_snapshot(moved_from)
+        if deleted:
+            catalog_search.menu_item_deleted(menu_item_id)
+        else:
+            catalog_search.menu_items_changed(MenuItem.objects.filter(pk=menu_item_id))
+
+    transaction.on_commit(on_commit)
+
+
+@receiver(post_init, sender=MenuItemCategory)
+def remember_menu_item_category(sender, instance, **kwargs):
+    instance._loaded_link = (
+        instance.__dict__.get("menu_item_id"),
+        instance.__dict__.get("category_id"),
+    )
+
+
+@receiver(post_save, sender=MenuItemCategory)
+@receiver(post_delete, sender=MenuItemCategory)
+def menu_item_category_changed(sender, instance, **kwargs):
+    menu_item_id = instance.menu_item_id
+    category_id = instance.category_id
+    menu_item_ids = {menu_item_id}
+    # Menu items that lost this link. A removed link leaves no row behind,
+    # so their updated_at is what other processes' search sync picks up.
+    unlinked = set()
+    if kwargs["signal"] is post_delete:
+        facets.shift(facets.restaurant_of(menu_item_id), category_id, -1)
+        unlinked.add(menu_item_id)
+    elif kwargs["created"]:
+        facets.shift(facets.restaurant_of(menu_item_id), category_id, 1)
+    elif instance._loaded_link != (menu_item_id, category_id):
+        old_menu_item_id, old_category_id = instance._loaded_link
+        facets.shift(facets.restaurant_of(old_menu_item_id), old_category_id, -1)
+        facets.shift(facets.restaurant_of(menu_item_id), category_id, 1)
+        menu_item_ids.add(old_menu_item_id)
+        if old_menu_item_id != menu_item_id:
+            unlinked.add(old_menu_item_id)
+    instance._loaded_link = (menu_item_id, category_id)
+    if unlinked:
+        MenuItem.objects.filter(pk__in=unlinked).update(updated_at=timezone.now())
+
+    def on_commit():
+        catalog_cache.bump("categories")
+        catalog_search.menu_items_changed(MenuItem.objects.filter(pk__in=menu_item_ids))
+
+    transaction.on_commit(on_commit)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, instance, **kwargs):
+    category_id = instance.category_id
+    deleted = kwargs["signal"] is post_delete
+
+    def on_commit():
+        catalog_cache.bump("categories")
+        if not deleted:
+            catalog_search.menu_items_changed(
+                MenuItem.objects.filter(menuitemcategory__category_id=category_id)
+            )
+
+    transaction.on_commit(on_commit)
+
+
+@receiver(post_save, sender=Coupon)
+@receiver(post_delete, sender=Coupon)
+def coupon_changed(sender, instance, **kwargs):
+    coupon_id = instance.coupon_id
+    deleted = kwargs["signal"] is post_delete
+
+    def on_commit():
+        if deleted:
+            coupon_index.coupon_deleted(coupon_id)
+        else:
+            coupon_index.coupon_changed(coupon_id)
+
+    transaction.on_commit(on_commit)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_saved(sender, instance, **kwargs):
+    # Drops the user from the authentication cache of every process, see
+    # authentication.py.
+    user_changed(instance.pk)
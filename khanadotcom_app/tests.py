@@ -1,3 +1,1631 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import itertools
+import smtplib
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core import mail
+from django.core.cache import cache
+from django.db import DatabaseError, connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from . import (
+    authentication,
+    catalog_cache,
+    dispatch,
+    dispatch_optimizer,
+    events,
+    facets,
+    idempotency,
+    order_state,
+    outbox,
+    throttling,
+)
+from .models import (
+    Category,
+    Coupon,
+    DeliveryPerson,
+    EmailsLogs,
+    FailedLoginAttempt,
+    MenuItem,
+    MenuItemCategory,
+    Order,
+    OrderItem,
+    Payment,
+    Restaurant,
+    RestaurantCategoryCount,
+    RestaurantOwner,
+    User,
+)
+from .compression import negotiate
+from .coupons import CouponIndex, InvalidCoupon, coupon_index, redemptions
+from .geo import GridIndex, NearbyRestaurants, haversine_km, nearby_restaurants
+from .metrics import metrics
+from .orders import place_order
+from .pagination import encode_cursor
+from .public import is_public
+from .search import CatalogSearch, SearchIndex, catalog_search, weigh_fields
+
+
+def create_restaurant(name="White Bricks", email="owner@example.com", **extra):
+    user = User.objects.create_user(
+        email=email, password="Secret@123", name="Owner", user_type="restaurant_owner"
+    )
+    owner = RestaurantOwner.objects.create(
+        user=user, aadhaar_card_number=str(user.pk).zfill(12)
+    )
+    return Restaurant.objects.create(
+        owner=owner,
+        name=name,
+        address="Gujarat",
+        phone_number="3456786578",
+        email=email,
+        profile_pic="restaurant_logo/11.png",
+        **extra,
+    )
+
+
+def create_menu_items(restaurant, count, **extra):
+    return [
+        MenuItem.objects.create(
+            restaurant=restaurant,
+            name=f"Dish {i}",
+            description="Pizza with lots of cheez",
+            price="500.00",
+            menu_item_pic=f"menu_items/{i}.png",
+            preparation_time=20,
+            **extra,
+        )
+        for i in range(count)
+    ]
+
+
+class CatalogTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        catalog_search.indexes = None
+        nearby_restaurants.index = None
+
+
+class MenuQueryBudgetTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.restaurant = create_restaurant()
+        other = create_restaurant(name="Blue Door", email="other@example.com")
+        create_menu_items(cls.restaurant, 25)
+        create_menu_items(other, 5)
+
+    # One aggregate for the conditional GET validators plus one joined SELECT
+    # for the rows, whatever the size of the catalog.
+    def test_menu_api_query_budget(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("menu_items_api"))
+        self.assertEqual(len(response.json()), 30)
+
+    def test_menu_by_restaurant_query_budget(self):
+        url = reverse(
+            "menu_items_by_restaurant_api", args=[self.restaurant.restaurant_id]
+        )
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        items = response.json()
+        self.assertEqual(len(items), 25)
+        self.assertEqual(items[0]["restaurant"], "White Bricks")
+        self.assertEqual(items[0]["restaurant_id"], self.restaurant.restaurant_id)
+        self.assertEqual(items[0]["image"], "/media/menu_items/0.png")
+
+    def test_query_count_does_not_grow_with_catalog(self):
+        create_menu_items(self.restaurant, 50)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("menu_items_api"), {"limit": 100})
+        self.assertEqual(len(response.json()), 80)
+
+
+class KeysetPaginationTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.restaurant = create_restaurant()
+        cls.items = create_menu_items(cls.restaurant, 7)
+        for item, rating in zip(cls.items, ["4.50", "3.00", "4.50", "5.00"]):
+            item.rating = rating
+            item.save()
+
+    def walk(self, params):
+        url, seen = reverse("menu_items_api"), []
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(item["id"] for item in response.json())
+            url, params = response.headers.get("Link"), None
+            if url:
+                url = url[1 : url.index(">")]
+        return seen
+
+    def test_pages_by_primary_key(self):
+        ids = [item.menu_item_id for item in self.items]
+        self.assertEqual(self.walk({"limit": 3}), ids)
+
+    def test_pages_by_rating_then_id(self):
+        expected = [
+            row.menu_item_id
+            for row in sorted(
+                self.items, key=lambda i: (-float(i.rating), -i.menu_item_id)
+            )
+        ]
+        self.assertEqual(self.walk({"limit": 2, "sort": "rating"}), expected)
+
+    def test_default_limit_applies_without_cursor(self):
+        with self.settings(CATALOG_PAGE_SIZE=5):
+            response = self.client.get(reverse("menu_items_api"))
+        self.assertEqual(len(response.json()), 5)
+        self.assertIn('rel="next"', response.headers["Link"])
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(reverse("menu_items_api"), {"cursor": "nope"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_tampered_cursor_is_rejected(self):
+        for url in (reverse("menu_items_api"), reverse("restaurant_list_api")):
+            for values in (["abc", "1"], 5, ["4.50"], [None, "1"], [["4.50"], "1"]):
+                with self.subTest(url=url, values=values):
+                    cursor = encode_cursor("rating", values)
+                    response = self.client.get(
+                        url, {"sort": "rating", "cursor": cursor}
+                    )
+                    self.assertEqual(response.status_code, 400)
+
+
+class CatalogCacheTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.restaurant = create_restaurant()
+        cls.item = create_menu_items(cls.restaurant, 3)[0]
+
+    def menu_url(self):
+        return reverse(
+            "menu_items_by_restaurant_api", args=[self.restaurant.restaurant_id]
+        )
+
+    def test_warm_reads_skip_the_database(self):
+        urls = [
+            reverse("restaurant_list_api"),
+            reverse("restaurant_detail_api", args=[self.restaurant.restaurant_id]),
+            self.menu_url(),
+        ]
+        for url in urls:
+            self.client.get(url)
+        with self.assertNumQueries(0):
+            for url in urls:
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_menu_item_save_invalidates_restaurant_menu(self):
+        self.client.get(self.menu_url())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item.name = "Margherita"
+            self.item.save()
+        names = [item["name"] for item in self.client.get(self.menu_url()).json()]
+        self.assertIn("Margherita", names)
+
+    def test_restaurant_save_invalidates_list_and_detail(self):
+        detail_url = reverse(
+            "restaurant_detail_api", args=[self.restaurant.restaurant_id]
+        )
+        self.client.get(reverse("restaurant_list_api"))
+        self.client.get(detail_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.restaurant.rating = "4.20"
+            self.restaurant.save()
+        listing = self.client.get(reverse("restaurant_list_api")).json()
+        self.assertEqual(float(listing[0]["rating"]), 4.2)
+        self.assertEqual(float(self.client.get(detail_url).json()["rating"]), 4.2)
+
+    def test_stale_entry_is_served_while_another_worker_rebuilds(self):
+        with self.settings(CATALOG_CACHE_TIMEOUT=-1):
+            self.client.get(self.menu_url())
+        scope = f"menu:{self.restaurant.restaurant_id}"
+        key = catalog_cache.ENTRY_KEY.format(
+            scope, catalog_cache.scope_version(scope), "snapshot", "-"
+        )
+        cache.add(key + catalog_cache.LOCK_SUFFIX, 1)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.menu_url())
+        self.assertEqual(len(response.json()), 3)
+
+
+class ConditionalGetTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.restaurant = create_restaurant()
+        cls.item = create_menu_items(cls.restaurant, 3)[0]
+        cls.url = reverse(
+            "menu_items_by_restaurant_api", args=[cls.restaurant.restaurant_id]
+        )
+
+    def test_responses_carry_validators(self):
+        for url in [
+            reverse("restaurant_list_api"),
+            reverse("restaurant_detail_api", args=[self.restaurant.restaurant_id]),
+            reverse("menu_items_api"),
+            self.url,
+        ]:
+            response = self.client.get(url)
+            self.assertTrue(response.headers["ETag"].startswith('"'))
+            self.assertIn("Last-Modified", response.headers)
+
+    def test_matching_etag_short_circuits_before_rows_are_fetched(self):
+        url = reverse("restaurant_list_api")
+        etag = self.client.get(url).headers["ETag"]
+        cache.clear()
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers["ETag"], etag)
+
+    def test_if_modified_since(self):
+        last_modified = self.client.get(self.url).headers["Last-Modified"]
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_changes_when_the_menu_changes(self):
+        etag = self.client.get(self.url).headers["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item.delete()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+
+class SearchIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = SearchIndex()
+        for key, name, rating in [
+            (1, "Paneer Tikka Pizza", 3.0),
+            (2, "Farmhouse Pizza", 5.0),
+            (3, "Paneer Butter Masala", 4.0),
+        ]:
+            self.index.add(
+                key,
+                {"type": "menu_item", "id": key, "rating": rating},
+                weigh_fields({"name": [name]}, {"name": 1.0}),
+            )
+
+    def ids(self, query):
+        return [hit["id"] for hit in self.index.search(query)]
+
+    def test_all_tokens_must_match(self):
+        self.assertEqual(self.ids("paneer pizza"), [1])
+
+    def test_rating_breaks_relevance_ties(self):
+        self.assertEqual(self.ids("pizza"), [2, 1])
+
+    def test_last_token_matches_as_prefix(self):
+        self.assertEqual(self.ids("butter mas"), [3])
+
+    def test_removed_documents_stop_matching(self):
+        self.index.remove(2)
+        self.assertEqual(self.ids("pizza"), [1])
+
+
+class SearchApiTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.restaurant = create_restaurant(name="White Bricks")
+        cls.item = create_menu_items(cls.restaurant, 1)[0]
+        category = Category.objects.create(name="Italian")
+        MenuItemCategory.objects.create(menu_item=cls.item, category=category)
+
+    def search(self, q, **params):
+        return self.client.get(reverse("search_api"), {"q": q, **params}).json()
+
+    def test_matches_restaurant_and_category_names(self):
+        hits = self.search("italian bricks")
+        self.assertEqual(
+            [(h["type"], h["id"]) for h in hits],
+            [("menu_item", self.item.menu_item_id)],
+        )
+        hits = self.search("bricks", type="restaurant")
+        self.assertEqual(hits[0]["id"], self.restaurant.restaurant_id)
+
+    def test_index_follows_model_saves(self):
+        self.search("dish")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item.name = "Margherita"
+            self.item.save()
+        with self.assertNumQueries(0):
+            catalog_search.search("margherita")
+        self.assertEqual(self.search("margherita")[0]["id"], self.item.menu_item_id)
+        self.assertEqual(self.search("dish"), [])
+
+    def test_other_processes_drop_deleted_rows(self):
+        other = CatalogSearch()
+        self.assertEqual(len(other.search("dish")), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            MenuItem.objects.get(pk=self.item.pk).delete()
+            self.restaurant.delete()
+        self.assertEqual(other.search("dish"), [])
+        self.assertEqual(other.search("bricks"), [])
+
+    def test_other_processes_drop_removed_categories(self):
+        # Written well before the other process builds its index, so only
+        # the removal itself can bring the menu item back into its sync.
+        long_ago = timezone.now() - timedelta(hours=1)
+        for model in (Restaurant, MenuItem, Category, MenuItemCategory):
+            model.objects.update(updated_at=long_ago)
+        other = CatalogSearch()
+        self.assertEqual(len(other.search("italian")), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            MenuItemCategory.objects.filter(menu_item=self.item).delete()
+        self.assertEqual(other.search("italian"), [])
+        self.assertEqual(len(other.search("dish")), 1)
+
+    def test_query_is_required(self):
+        response = self.client.get(reverse("search_api"))
+        self.assertEqual(response.status_code, 400)
+
+
+class MenuSnapshotTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.restaurant = create_restaurant()
+        cls.item = create_menu_items(cls.restaurant, 3)[0]
+        cls.url = reverse(
+            "menu_items_by_restaurant_api", args=[cls.restaurant.restaurant_id]
+        )
+
+    def test_snapshot_is_served_without_queries(self):
+        body = self.client.get(self.url).content
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.content, body)
+        self.assertEqual(response.headers["Content-Type"], "application/json")
+
+    def test_snapshot_is_rebuilt_on_commit(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item.availability = False
+            self.item.rating = "4.00"
+            self.item.save()
+        with self.assertNumQueries(0):
+            items = self.client.get(self.url).json()
+        self.assertEqual((items[0]["availability"], items[0]["rating"]), (False, 4.0))
+
+    def test_restaurant_rename_reaches_the_snapshot(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.restaurant.name = "Blue Door"
+            self.restaurant.save()
+        items = self.client.get(self.url).json()
+        self.assertEqual(items[0]["restaurant"], "Blue Door")
+
+
+class GridIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = GridIndex()
+        for key, lat, lng, rating in [
+            (1, 23.0225, 72.5714, 3.0),
+            (2, 23.0300, 72.5800, 5.0),
+            (3, 23.1000, 72.6500, 4.0),
+            (4, 21.1702, 72.8311, 5.0),
+        ]:
+            self.index.upsert(key, lat, lng, {"id": key, "rating": rating})
+
+    def ids(self, radius_km, limit=10):
+        return [
+            hit["id"] for hit in self.index.nearest(23.0225, 72.5714, radius_km, limit)
+        ]
+
+    def test_nearest_within_radius_by_distance(self):
+        self.assertEqual(self.ids(5), [1, 2])
+        self.assertEqual(self.ids(15), [1, 2, 3])
+        self.assertEqual(self.ids(15, limit=2), [1, 2])
+
+    def test_matches_brute_force(self):
+        hits = self.index.nearest(23.05, 72.6, 300, 3)
+        expected = sorted(
+            (haversine_km(23.05, 72.6, lat, lng), key)
+            for key, lat, lng in [
+                (1, 23.0225, 72.5714),
+                (2, 23.0300, 72.5800),
+                (3, 23.1000, 72.6500),
+                (4, 21.1702, 72.8311),
+            ]
+        )[:3]
+        self.assertEqual([hit["id"] for hit in hits], [key for _, key in expected])
+
+    def test_poles_are_bounded(self):
+        self.index.upsert(5, 89.995, 120.0, {"id": 5, "rating": 4.0})
+        self.index.upsert(6, -89.995, -60.0, {"id": 6, "rating": 4.0})
+        for lat, expected in ((90, [5]), (-89.99, [6])):
+            with self.subTest(lat=lat):
+                started = time.perf_counter()
+                hits = self.index.nearest(lat, 0, 50, 20)
+                self.assertLess(time.perf_counter() - started, 1)
+                self.assertEqual([hit["id"] for hit in hits], expected)
+
+    def test_moved_and_removed_restaurants(self):
+        self.index.upsert(3, 23.0226, 72.5715, {"id": 3, "rating": 4.0})
+        self.index.remove(1)
+        self.assertEqual(self.ids(5), [3, 2])
+
+
+class NearbyRestaurantsApiTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.near = create_restaurant(
+            name="Near",
+            email="near@example.com",
+            latitude="23.022500",
+            longitude="72.571400",
+        )
+        cls.far = create_restaurant(
+            name="Far",
+            email="far@example.com",
+            latitude="23.100000",
+            longitude="72.650000",
+        )
+        create_restaurant(name="Unmapped", email="unmapped@example.com")
+
+    def nearby(self, **params):
+        return self.client.get(
+            reverse("nearby_restaurants_api"),
+            {"lat": "23.0225", "lng": "72.5714", **params},
+        )
+
+    def test_returns_restaurants_within_radius(self):
+        hits = self.nearby(radius_km="20").json()
+        self.assertEqual([h["id"] for h in hits], [self.near.pk, self.far.pk])
+        self.assertEqual(hits[0]["distance_km"], 0)
+        self.assertEqual([h["id"] for h in self.nearby().json()], [self.near.pk])
+
+    def test_index_follows_model_saves(self):
+        self.nearby()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.far.latitude, self.far.longitude = "23.023000", "72.572000"
+            self.far.save()
+        with self.assertNumQueries(0):
+            nearby_restaurants.nearest(23.0225, 72.5714, 5, 10)
+        self.assertEqual(len(self.nearby().json()), 2)
+
+    def test_other_processes_drop_deleted_restaurants(self):
+        other = NearbyRestaurants()
+        self.assertEqual(len(other.nearest(23.0225, 72.5714, 20, 10)), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.far.delete()
+        hits = other.nearest(23.0225, 72.5714, 20, 10)
+        self.assertEqual([hit["id"] for hit in hits], [self.near.pk])
+
+    def test_coordinates_are_required(self):
+        self.assertEqual(
+            self.client.get(reverse("nearby_restaurants_api")).status_code, 400
+        )
+        self.assertEqual(self.nearby(lng="").status_code, 400)
+        self.assertEqual(self.nearby(radius_km="500").status_code, 400)
+
+
+class SparseFieldsetTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.restaurant = create_restaurant()
+        cls.items = create_menu_items(cls.restaurant, 3, rating="4.00")
+        cls.customer = User.objects.create_user(
+            email="customer@example.com",
+            password="Secret@123",
+            name="Customer",
+            user_type="customer",
+            is_active=True,
+        )
+        order = Order.objects.create(
+            user=cls.customer, total_amount="1000.00", delivery_address="Gujarat"
+        )
+        OrderItem.objects.create(
+            order=order, menu_item=cls.items[0], quantity=2, price="500.00"
+        )
+
+    def get(self, name, params, *args):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(name, args=args), params)
+        return response, [query["sql"] for query in queries]
+
+    def test_fields_are_pushed_into_the_select(self):
+        response, sql = self.get("menu_items_api", {"fields": "id,name,image"})
+        self.assertEqual(list(response.json()[0]), ["id", "name", "image"])
+        self.assertNotIn('"description"', sql[-1])
+        self.assertNotIn('"restaurant_details"', sql[-1])
+
+    def test_exclude_and_keyset_sort_columns(self):
+        response, sql = self.get(
+            "menu_items_api", {"exclude": "description", "sort": "rating", "limit": 2}
+        )
+        self.assertNotIn("description", response.json()[0])
+        self.assertNotIn('"description"', sql[-1])
+        self.assertIn("X-Next-Cursor", response.headers)
+
+    def test_sparse_restaurant_menu_and_detail(self):
+        restaurant_id = self.restaurant.restaurant_id
+        response, _ = self.get(
+            "menu_items_by_restaurant_api", {"fields": "id,price"}, restaurant_id
+        )
+        self.assertEqual(list(response.json()[0]), ["id", "price"])
+        full = self.client.get(
+            reverse("menu_items_by_restaurant_api", args=[restaurant_id])
+        )
+        self.assertNotEqual(response["ETag"], full["ETag"])
+        response, sql = self.get(
+            "restaurant_detail_api", {"fields": "name"}, restaurant_id
+        )
+        self.assertEqual(response.json(), {"name": "White Bricks"})
+        self.assertNotIn('"restaurant_GST"', sql[-1])
+
+    def test_order_history_without_items(self):
+        token = RefreshToken.for_user(self.customer).access_token
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Bearer {token}"
+        response, sql = self.get("order_history_api", {"exclude": "items"})
+        self.assertNotIn("items", response.json()[0])
+        self.assertFalse(any('"order_item"' in query for query in sql))
+        response, _ = self.get("order_history_api", {"fields": "order_id,items"})
+        self.assertEqual(
+            response.json()[0],
+            {
+                "order_id": response.json()[0]["order_id"],
+                "items": [
+                    {
+                        "menu_item": self.items[0].menu_item_id,
+                        "menu_item_name": "Dish 0",
+                        "menu_item_image": "/media/menu_items/0.png",
+                        "quantity": 2,
+                        "price": "500.00",
+                    }
+                ],
+            },
+        )
+
+    def test_unknown_field_is_rejected(self):
+        response, _ = self.get("menu_items_api", {"fields": "id,secret"})
+        self.assertEqual(response.status_code, 400)
+
+
+class CompressionTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.restaurant = create_restaurant()
+        create_menu_items(cls.restaurant, 20)
+        cls.url = reverse(
+            "menu_items_by_restaurant_api", args=[cls.restaurant.restaurant_id]
+        )
+
+    def setUp(self):
+        super().setUp()
+        metrics.reset()
+
+    def test_negotiation(self):
+        self.assertEqual(negotiate("gzip, deflate"), "gzip")
+        self.assertEqual(negotiate("*"), negotiate("zstd, br, gzip"))
+        self.assertIsNone(negotiate("gzip;q=0, identity"))
+        self.assertIsNone(negotiate(""))
+
+    def test_catalog_body_is_compressed_once(self):
+        plain = self.client.get(self.url).content
+        for _ in range(3):
+            response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip")
+            self.assertEqual(response["Content-Encoding"], "gzip")
+            self.assertEqual(gzip.decompress(response.content), plain)
+        self.assertEqual(metrics.get("compression.gzip.compressed"), 1)
+        self.assertEqual(metrics.get("compression.gzip.cache_hits"), 2)
+        self.assertIn("Accept-Encoding", response["Vary"])
+
+    def test_weak_etag_still_revalidates(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertTrue(response["ETag"].startswith('W/"'))
+        response = self.client.get(
+            self.url,
+            HTTP_ACCEPT_ENCODING="gzip",
+            HTTP_IF_NONE_MATCH=response["ETag"],
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_not_modified_echoes_the_clients_etag(self):
+        weak = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip")["ETag"]
+        strong = self.client.get(self.url)["ETag"]
+        self.assertEqual(weak, "W/" + strong)
+        for etag in (weak, strong):
+            with self.subTest(etag=etag):
+                response = self.client.get(
+                    self.url, HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=etag
+                )
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response["ETag"], etag)
+        last_modified = self.client.get(self.url)["Last-Modified"]
+        for encoding, etag in (("gzip", weak), ("", strong)):
+            with self.subTest(encoding=encoding):
+                response = self.client.get(
+                    self.url,
+                    HTTP_ACCEPT_ENCODING=encoding,
+                    HTTP_IF_MODIFIED_SINCE=last_modified,
+                )
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response["ETag"], etag)
+
+    def test_metrics_are_staff_only(self):
+        self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertIn(self.client.get(reverse("metrics_api")).status_code, (401, 403))
+        staff = User.objects.create_user(
+            email="staff@example.com",
+            password="Secret@123",
+            name="Staff",
+            is_staff=True,
+            is_active=True,
+        )
+        token = RefreshToken.for_user(staff).access_token
+        response = self.client.get(
+            reverse("metrics_api"), HTTP_AUTHORIZATION=f"Bearer {token}"
+        )
+        report = response.json()["compression"]["gzip"]
+        self.assertEqual(report["responses"], 1)
+        self.assertLess(report["ratio"], 0.5)
+
+
+class CategoryFacetTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.restaurant = create_restaurant()
+        cls.other = create_restaurant(name="Blue Door", email="other@example.com")
+        cls.items = create_menu_items(cls.restaurant, 3) + create_menu_items(
+            cls.other, 2
+        )
+        cls.pizza = Category.objects.create(name="Pizza")
+        cls.drinks = Category.objects.create(name="Drinks")
+        for item in cls.items:
+            MenuItemCategory.objects.create(menu_item=item, category=cls.pizza)
+        MenuItemCategory.objects.create(menu_item=cls.items[0], category=cls.drinks)
+
+    def counts(self):
+        return {
+            "category": dict(Category.objects.values_list("name", "item_count")),
+            "restaurant": {
+                (row.restaurant.name, row.category.name): row.item_count
+                for row in RestaurantCategoryCount.objects.filter(item_count__gt=0)
+            },
+        }
+
+    def test_counters_follow_links(self):
+        self.assertEqual(
+            self.counts(),
+            {
+                "category": {"Pizza": 5, "Drinks": 1},
+                "restaurant": {
+                    ("White Bricks", "Pizza"): 3,
+                    ("White Bricks", "Drinks"): 1,
+                    ("Blue Door", "Pizza"): 2,
+                },
+            },
+        )
+        link = MenuItemCategory.objects.get(menu_item=self.items[4])
+        link.category = self.drinks
+        link.save()
+        self.items[1].delete()
+        self.items[2].restaurant = self.other
+        self.items[2].save()
+        expected = self.counts()
+        self.assertEqual(
+            expected,
+            {
+                "category": {"Pizza": 3, "Drinks": 2},
+                "restaurant": {
+                    ("White Bricks", "Pizza"): 1,
+                    ("White Bricks", "Drinks"): 1,
+                    ("Blue Door", "Pizza"): 2,
+                    ("Blue Door", "Drinks"): 1,
+                },
+            },
+        )
+        facets.rebuild()
+        self.assertEqual(self.counts(), expected)
+
+    def test_facets_are_read_without_group_by(self):
+        url = reverse("categories_api")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {"restaurant_id": self.other.pk})
+        self.assertEqual(
+            [(c["name"], c["item_count"]) for c in response.json()], [("Pizza", 2)]
+        )
+        self.assertFalse(any("GROUP BY" in q["sql"] for q in queries))
+        with self.assertNumQueries(0):
+            self.client.get(url, {"restaurant_id": self.other.pk})
+        with self.captureOnCommitCallbacks(execute=True):
+            MenuItemCategory.objects.create(
+                menu_item=self.items[3], category=self.drinks
+            )
+        response = self.client.get(url)
+        self.assertEqual(
+            [(c["name"], c["item_count"]) for c in response.json()],
+            [("Drinks", 2), ("Pizza", 5)],
+        )
+
+    def test_category_items(self):
+        url = reverse("category_items_api", args=[self.drinks.pk])
+        response = self.client.get(url, {"fields": "id,name"})
+        self.assertEqual(
+            response.json(), [{"id": self.items[0].pk, "name": self.items[0].name}]
+        )
+        response = self.client.get(
+            reverse("category_items_api", args=[self.pizza.pk]),
+            {"restaurant_id": self.other.pk},
+        )
+        self.assertEqual(
+            [i["id"] for i in response.json()], [i.pk for i in self.items[3:]]
+        )
+        response = self.client.get(reverse("category_items_api", args=[0]))
+        self.assertEqual(response.status_code, 404)
+
+
+class PublicRouteTests(SimpleTestCase):
+    def test_marked_routes_compile_into_one_match(self):
+        for path in (
+            "/login/",
+            "/activate/MQ/set-password/",
+            "/api/restaurants/3/menu/",
+            "/admin",
+            "/admin/login/",
+        ):
+            with self.subTest(path=path):
+                self.assertTrue(is_public(path))
+        for path in ("/profile-user/", "/order/history/", "/login/extra/", "/api/x"):
+            with self.subTest(path=path):
+                self.assertFalse(is_public(path))
+
+    def test_unmarked_views_need_a_token(self):
+        response = self.client.get(reverse("user_profile_api"))
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.content, b"Unauthorized: Token is missing")
+
+
+class OrderTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.restaurant = create_restaurant()
+        cls.items = create_menu_items(cls.restaurant, 15)
+        other = create_restaurant(name="Blue Door", email="other@example.com")
+        cls.foreign = create_menu_items(other, 1)[0]
+        cls.customer = User.objects.create_user(
+            email="customer@example.com",
+            password="Secret@123",
+            name="Customer",
+            user_type="customer",
+            address="Gujarat",
+            is_active=True,
+        )
+
+    def setUp(self):
+        token = RefreshToken.for_user(self.customer).access_token
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Bearer {token}"
+        self.url = reverse("order_placement_api", args=[self.restaurant.restaurant_id])
+
+    def cart(self, items, quantity=2):
+        return [{"item_id": item.menu_item_id, "quantity": quantity} for item in items]
+
+
+@override_settings(
+    LOGIN_THROTTLE_WINDOW=600,
+    LOGIN_THROTTLE_EMAIL_LIMIT=6,
+    LOGIN_THROTTLE_IP_LIMIT=8,
+)
+class LoginThrottleTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email="customer@example.com",
+            password="Secret@123",
+            name="Customer",
+            user_type="customer",
+            is_active=True,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse("login_api")
+        # Halfway through a bucket, whatever the wall clock says.
+        self.now = 600 * 1000 + 300
+        clock = mock.patch(
+            "khanadotcom_app.throttling.time", SimpleNamespace(time=lambda: self.now)
+        )
+        clock.start()
+        self.addCleanup(clock.stop)
+
+    def login(self, password="Wrong@123", email="customer@example.com"):
+        return self.client.post(
+            self.url,
+            {"email": email, "password": password},
+            content_type="application/json",
+        )
+
+    def test_failures_stay_in_the_cache(self):
+        for email in ("customer@example.com", "guess@example.com"):
+            # Just the user lookup of authenticate()
+            with self.assertNumQueries(1):
+                self.assertEqual(self.login(email=email).status_code, 401)
+        self.assertFalse(FailedLoginAttempt.objects.exists())
+
+    def test_reset_email_is_sent_once(self):
+        for _ in range(4):
+            self.assertEqual(self.login().status_code, 401)
+        self.assertEqual(self.login().status_code, 403)
+        email = EmailsLogs.objects.get(is_sent=outbox.PENDING)
+        self.assertEqual(email.recipient, self.user.email)
+        self.assertEqual(
+            FailedLoginAttempt.objects.get(user=self.user).attempt_count, 5
+        )
+        with self.assertNumQueries(1):
+            self.assertEqual(self.login().status_code, 403)
+        self.assertEqual(EmailsLogs.objects.count(), 1)
+
+        self.now += 2 * 600  # past the throttling window
+        self.assertEqual(self.login("Secret@123").status_code, 200)
+        self.assertFalse(FailedLoginAttempt.objects.filter(user=self.user).exists())
+
+    def test_throttled_attempts_skip_hashing(self):
+        for _ in range(6):
+            self.login()
+        with mock.patch("khanadotcom_app.views.authenticate") as authenticate:
+            with self.assertNumQueries(0):
+                response = self.login("Secret@123")
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response["Retry-After"]), 0)
+        authenticate.assert_not_called()
+
+    def test_ip_limit_spans_emails(self):
+        for number in range(8):
+            self.login(email=f"guess{number}@example.com")
+        self.assertEqual(self.login().status_code, 429)
+
+    def test_forwarded_for_is_ignored_without_proxies(self):
+        for number in range(8):
+            self.client.post(
+                self.url,
+                {"email": f"guess{number}@example.com", "password": "Wrong@123"},
+                content_type="application/json",
+                HTTP_X_FORWARDED_FOR=f"10.0.0.{number}",
+            )
+        self.assertEqual(self.login().status_code, 429)
+
+    def test_client_ip_behind_proxies(self):
+        request = SimpleNamespace(
+            META={
+                "REMOTE_ADDR": "10.0.0.2",
+                "HTTP_X_FORWARDED_FOR": "6.6.6.6, 203.0.113.7, 10.0.0.1",
+            }
+        )
+        self.assertEqual(throttling.client_ip(request), "10.0.0.2")
+        with self.settings(LOGIN_TRUSTED_PROXIES=2):
+            self.assertEqual(throttling.client_ip(request), "203.0.113.7")
+        with self.settings(LOGIN_TRUSTED_PROXIES=4):
+            # Fewer entries than proxies: the header was not set by them.
+            self.assertEqual(throttling.client_ip(request), "10.0.0.2")
+
+    @override_settings(LOGIN_TRUSTED_PROXIES=1)
+    def test_ip_limit_counts_forwarded_clients(self):
+        for number in range(8):
+            self.client.post(
+                self.url,
+                {"email": f"guess{number}@example.com", "password": "Wrong@123"},
+                content_type="application/json",
+                HTTP_X_FORWARDED_FOR=f"203.0.113.{number}",
+            )
+        self.assertEqual(self.login().status_code, 401)
+
+    def test_window_slides(self):
+        start = 600 * 1000
+        for _ in range(8):
+            throttling.login_failed("a@example.com", "10.0.0.1", now=start)
+        self.assertIsNotNone(throttling.throttled("a@example.com", "", now=start))
+        # Into the next bucket the old failures count for the part of the
+        # window they still cover: 80% of 8, then 50% of 8.
+        self.assertIsNotNone(throttling.throttled("a@example.com", "", now=start + 720))
+        self.assertIsNone(throttling.throttled("a@example.com", "", now=start + 900))
+
+
+class OutboxTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email="customer@example.com",
+            password="Secret@123",
+            name="Customer",
+            user_type="customer",
+            is_active=True,
+        )
+
+    def setUp(self):
+        metrics.reset()
+
+    def enqueue(self, count):
+        for number in range(count):
+            outbox.enqueue(
+                f"Hello {number}", "Body", f"to{number}@example.com", self.user
+            )
+
+    def test_views_only_enqueue(self):
+        response = self.client.post(
+            reverse("password_reset"),
+            {"email": self.user.email},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mail.outbox, [])
+        email = EmailsLogs.objects.get()
+        self.assertEqual(email.is_sent, outbox.PENDING)
+        self.assertEqual(email.recipient, self.user.email)
+
+    def test_drain_reuses_one_connection_per_worker(self):
+        self.enqueue(7)
+        with outbox.Sender(workers=2) as sender:
+            self.assertEqual(outbox.drain(sender, batch_size=3), (7, 0))
+            self.assertEqual(outbox.drain(sender, batch_size=3), (0, 0))
+        self.assertLessEqual(outbox.report()["connections"], 2)
+        self.assertEqual(len(mail.outbox), 7)
+        self.assertEqual(EmailsLogs.objects.filter(is_sent=outbox.SENT).count(), 7)
+
+    @override_settings(OUTBOX_MAX_ATTEMPTS=2, OUTBOX_RETRY_BASE_SECONDS=60)
+    def test_failures_back_off_then_give_up(self):
+        self.enqueue(1)
+        with mock.patch(
+            "django.core.mail.backends.locmem.EmailBackend.send_messages",
+            side_effect=ConnectionError,
+        ):
+            with outbox.Sender(workers=1) as sender:
+                self.assertEqual(outbox.drain(sender, batch_size=10), (0, 1))
+                # Not due again for a minute.
+                self.assertEqual(outbox.drain(sender, batch_size=10), (0, 0))
+                email = EmailsLogs.objects.get()
+                self.assertEqual(email.attempts, 1)
+                self.assertGreater(
+                    email.to_be_sent_date, timezone.now() + timedelta(seconds=50)
+                )
+                EmailsLogs.objects.update(to_be_sent_date=timezone.now())
+                self.assertEqual(outbox.drain(sender, batch_size=10), (0, 1))
+        email = EmailsLogs.objects.get()
+        self.assertEqual((email.is_sent, email.attempts), (outbox.FAILED, 2))
+        self.assertEqual(mail.outbox, [])
+
+    def test_dropped_connection_is_reopened_once(self):
+        self.enqueue(1)
+        with mock.patch(
+            "django.core.mail.backends.locmem.EmailBackend.send_messages",
+            side_effect=[smtplib.SMTPServerDisconnected, 1],
+        ):
+            with outbox.Sender(workers=1) as sender:
+                self.assertEqual(outbox.drain(sender, batch_size=10), (1, 0))
+        email = EmailsLogs.objects.get()
+        self.assertEqual((email.is_sent, email.attempts), (outbox.SENT, 1))
+        self.assertEqual(outbox.report()["connections"], 2)
+
+        self.enqueue(1)
+        with mock.patch(
+            "django.core.mail.backends.locmem.EmailBackend.send_messages",
+            side_effect=smtplib.SMTPServerDisconnected,
+        ) as send_messages:
+            with outbox.Sender(workers=1) as sender:
+                self.assertEqual(outbox.drain(sender, batch_size=10), (0, 1))
+        self.assertEqual(send_messages.call_count, 2)
+        email = EmailsLogs.objects.get(is_sent=outbox.PENDING)
+        self.assertEqual(email.attempts, 1)
+
+
+class UserCacheTests(OrderTestCase):
+    def setUp(self):
+        super().setUp()
+        authentication.user_cache.clear()
+        authentication.token_cache.clear()
+        metrics.reset()
+        self.profile_url = reverse("user_profile_api")
+
+    def test_warm_requests_skip_the_user_query(self):
+        with self.assertNumQueries(1):
+            self.client.get(self.profile_url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.profile_url)
+        self.assertEqual(response.json()["name"], "Customer")
+
+    def test_token_is_verified_once(self):
+        with mock.patch.object(
+            AccessToken, "verify", autospec=True, side_effect=AccessToken.verify
+        ) as verify:
+            self.client.get(self.profile_url)
+            self.client.get(self.profile_url)
+        self.assertEqual(verify.call_count, 1)
+        self.assertEqual(metrics.get("auth.request_reuses"), 2)
+        self.assertEqual(
+            authentication.report()["token_cache"],
+            {"hits": 1, "misses": 1, "hit_rate": 0.5},
+        )
+
+    def test_expired_tokens_are_not_kept(self):
+        token = AccessToken.for_user(self.customer)
+        authentication.token_cache.put("digest", token)
+        self.assertIs(authentication.token_cache.get("digest"), token)
+        token.set_exp(lifetime=-timedelta(seconds=1))
+        authentication.token_cache.put("digest", token)
+        self.assertIsNone(authentication.token_cache.get("digest"))
+
+    def test_profile_update_is_seen_on_the_next_request(self):
+        self.client.get(self.profile_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(
+                reverse("update_profile_user"),
+                {"name": "Renamed"},
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(self.profile_url).json()["name"], "Renamed")
+
+    def test_password_change_and_deactivation_reload_the_user(self):
+        token = RefreshToken.for_user(self.customer).access_token
+        authenticator = authentication.CachedJWTAuthentication()
+        authenticator.get_user(token)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("change_password_api"),
+                {"current_password": "Secret@123", "new_password": "Changed@456"},
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(1):
+            user = authenticator.get_user(token)
+        self.assertTrue(user.check_password("Changed@456"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            user.is_active = False
+            user.save()
+        with self.assertRaises(AuthenticationFailed):
+            authenticator.get_user(token)
+
+
+class CouponTests(OrderTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        coupon_index._by_code = None
+        now = timezone.now()
+        self.coupon = Coupon.objects.create(
+            code="SAVE10",
+            discount_percentage="10.00",
+            max_discount_amount="150.00",
+            valid_from=now - timedelta(days=1),
+            valid_to=now + timedelta(hours=1),
+        )
+
+    def place(self, **data):
+        return self.client.post(
+            self.url,
+            {"items": self.cart(self.items[:2]), **data},
+            content_type="application/json",
+        )
+
+    def test_coupon_costs_no_extra_round_trip(self):
+        coupon_index.lookup("SAVE10")
+        self.place()  # loads the customer into the authentication cache
+        with CaptureQueriesContext(connection) as plain:
+            self.place()
+        with self.captureOnCommitCallbacks(execute=True):
+            with CaptureQueriesContext(connection) as discounted:
+                response = self.place(coupon_code=" save10 ")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(discounted), len(plain))
+        # 10% of 2000.00, capped at 150.00
+        self.assertEqual(response.json()["discount_amount"], 150.0)
+        order = Order.objects.get(pk=response.json()["order_id"])
+        self.assertEqual(order.total_amount, Decimal("1850.00"))
+        self.assertEqual(order.coupon_id, self.coupon.pk)
+        self.assertEqual(Payment.objects.get(order=order).amount, Decimal("1850.00"))
+        self.assertEqual(redemptions(self.coupon.pk), 1)
+
+    def test_codes_must_be_strings(self):
+        for code in (5, ["SAVE10"], {"code": "SAVE10"}):
+            with self.subTest(code=code):
+                response = self.place(coupon_code=code)
+                self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    def test_expired_coupons_drop_without_a_query(self):
+        coupon_index.lookup("SAVE10")
+        later = timezone.now() + timedelta(hours=2)
+        with self.assertNumQueries(0):
+            with self.assertRaises(InvalidCoupon):
+                coupon_index.lookup("SAVE10", now=later)
+        self.assertEqual(coupon_index._by_code, {})
+
+    def test_changes_reach_every_index(self):
+        other = CouponIndex()  # stands in for another worker process
+        coupon_index.lookup("SAVE10")
+        other.lookup("SAVE10")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.coupon.active = False
+            self.coupon.save()
+        response = self.place(coupon_code="SAVE10")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+        with self.assertRaises(InvalidCoupon):
+            other.lookup("SAVE10")
+
+
+class OrderHistoryTests(OrderTestCase):
+    def place_orders(self, count):
+        orders = [
+            Order.objects.create(
+                user=self.customer, total_amount="1000.00", delivery_address="Gujarat"
+            )
+            for _ in range(count)
+        ]
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, menu_item=item, quantity=1, price="500.00")
+            for order in orders
+            for item in self.items[:2]
+        )
+        return orders
+
+    def history(self, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("order_history_api"), params)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_pages_newest_first(self):
+        orders = self.place_orders(25)
+        response, _ = self.history()
+        first = response.json()
+        self.assertEqual(len(first), 20)
+        response, _ = self.history({"cursor": response["X-Next-Cursor"]})
+        self.assertNotIn("X-Next-Cursor", response.headers)
+        newest_first = sorted(
+            orders, key=lambda order: (order.order_date, order.pk), reverse=True
+        )
+        self.assertEqual(
+            [order["order_id"] for order in first + response.json()],
+            [order.pk for order in newest_first],
+        )
+        self.assertEqual(
+            first[0]["items"][1],
+            {
+                "menu_item": self.items[1].menu_item_id,
+                "menu_item_name": "Dish 1",
+                "menu_item_image": "/media/menu_items/1.png",
+                "quantity": 1,
+                "price": "500.00",
+            },
+        )
+
+    def test_query_count_does_not_grow_with_history(self):
+        self.place_orders(1)
+        _, short = self.history()
+        self.place_orders(40)
+        response, long = self.history()
+        self.assertEqual(len(response.json()), 20)
+        self.assertEqual(long, short)
+
+    def test_tampered_cursor_is_rejected(self):
+        for values in (["garbage", "1"], ["2024-01-01 10:00:00+00:00", "x"]):
+            with self.subTest(values=values):
+                response = self.client.get(
+                    reverse("order_history_api"),
+                    {"cursor": encode_cursor("newest", values)},
+                )
+                self.assertEqual(response.status_code, 400)
+
+
+class OrderPlacementTests(OrderTestCase):
+    def place(self, items):
+        return self.client.post(
+            self.url, {"items": items}, content_type="application/json"
+        )
+
+    def test_round_trips_do_not_grow_with_cart(self):
+        with CaptureQueriesContext(connection) as one:
+            self.place(self.cart(self.items[:1]))
+        with CaptureQueriesContext(connection) as fifteen:
+            response = self.place(self.cart(self.items))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(fifteen), len(one))
+        order = Order.objects.get(pk=response.json()["order_id"])
+        self.assertEqual(order.orderitem_set.count(), 15)
+        self.assertEqual(Payment.objects.get(order=order).amount, order.total_amount)
+
+    def test_total_is_price_times_quantity(self):
+        cart = self.cart(self.items[:2], quantity=3) + self.cart(self.items[:1])
+        response = self.place(cart)
+        self.assertEqual(float(response.json()["total_amount"]), 500 * 8)
+        quantities = dict(
+            OrderItem.objects.filter(order_id=response.json()["order_id"]).values_list(
+                "menu_item_id", "quantity"
+            )
+        )
+        self.assertEqual(
+            quantities, {self.items[0].menu_item_id: 5, self.items[1].menu_item_id: 3}
+        )
+
+    def test_rejected_carts_write_nothing(self):
+        self.items[1].availability = False
+        self.items[1].save()
+        for items, status_code in [
+            (self.cart([self.items[0], self.foreign]), 400),
+            (self.cart(self.items[:2]), 400),
+            ([{"item_id": 0, "quantity": 1}], 404),
+            (self.cart(self.items[:1], quantity=0), 400),
+            ([], 400),
+        ]:
+            self.assertEqual(self.place(items).status_code, status_code)
+        self.assertFalse(Order.objects.exists())
+
+
+class IdempotencyKeyTests(OrderTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def place(self, items, key="retry-1"):
+        return self.client.post(
+            self.url,
+            {"items": items},
+            content_type="application/json",
+            HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_retry_replays_the_first_response(self):
+        first = self.place(self.cart(self.items[:2]))
+        with self.assertNumQueries(0):
+            retry = self.place(self.cart(self.items[:2]))
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(
+            self.place(self.cart(self.items[:2]), key="retry-2").status_code, 201
+        )
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_key_reused_for_another_cart(self):
+        self.place(self.cart(self.items[:2]))
+        self.assertEqual(self.place(self.cart(self.items[:3])).status_code, 422)
+
+    def test_concurrent_duplicate_shares_the_first_result(self):
+        record_key = idempotency._record_key(
+            SimpleNamespace(user=self.customer, path=self.url), "retry-1"
+        )
+        request = SimpleNamespace(
+            method="POST", path=self.url, data={"items": self.cart(self.items[:1])}
+        )
+        cache.add(record_key + idempotency.LOCK_SUFFIX, 1)
+
+        def finish_first_attempt():
+            cache.set(
+                record_key,
+                {
+                    "fingerprint": idempotency.fingerprint(request),
+                    "status": 201,
+                    "data": {"order_id": 42},
+                },
+            )
+
+        threading.Timer(0.1, finish_first_attempt).start()
+        response = self.place(self.cart(self.items[:1]))
+        self.assertEqual(response.json(), {"order_id": 42})
+        self.assertFalse(Order.objects.exists())
+
+    @mock.patch.object(idempotency, "LOCK_TIMEOUT", 0.2)
+    def test_duplicate_gives_up_while_first_attempt_runs(self):
+        record_key = idempotency._record_key(
+            SimpleNamespace(user=self.customer, path=self.url), "retry-1"
+        )
+        cache.add(record_key + idempotency.LOCK_SUFFIX, 1)
+        self.assertEqual(self.place(self.cart(self.items[:1])).status_code, 409)
+
+
+class OrderStateTests(OrderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.order = Order.objects.create(
+            user=self.customer, total_amount="500.00", delivery_address="Gujarat"
+        )
+        owner = self.restaurant.owner.user
+        owner.is_active = True
+        owner.save()
+        token = RefreshToken.for_user(owner).access_token
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Bearer {token}"
+
+    def status(self):
+        self.order.refresh_from_db()
+        return self.order.order_status
+
+    def test_transition_is_one_conditional_update(self):
+        with CaptureQueriesContext(connection) as queries:
+            order_state.transition(self.order.pk, "confirmed")
+        self.assertEqual(len(queries), 1)
+        sql = queries[0]["sql"]
+        self.assertIn('"order_status" IN', sql)
+        self.assertNotIn('"total_amount"', sql)
+        self.assertEqual(self.status(), "confirmed")
+
+    def test_illegal_transition_changes_nothing(self):
+        with self.assertRaises(order_state.InvalidTransition) as raised:
+            order_state.transition(self.order.pk, "delivered")
+        self.assertEqual(raised.exception.current, "pending")
+        self.assertEqual(self.status(), "pending")
+        with self.assertRaises(Order.DoesNotExist):
+            order_state.transition(0, "confirmed")
+
+    def test_losing_actor_gets_a_conflict(self):
+        url = reverse("confirm_order", args=[self.order.pk])
+        response = self.client.post(url, {"status": "confirmed"})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post(url, {"status": "rejected"})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.status(), "confirmed")
+
+    def test_preparing_requires_a_confirmed_order(self):
+        url = reverse("update_order_status_to_preparing", args=[self.order.pk])
+        self.assertEqual(self.client.put(url).status_code, 409)
+        order_state.transition(self.order.pk, "confirmed")
+        self.assertEqual(self.client.put(url).status_code, 200)
+        self.assertEqual(self.status(), "preparing")
+
+    def test_assignment_claims_one_driver(self):
+        driver = DeliveryPerson.objects.create(
+            user=self.customer, aadhaar_card_number="999988887777"
+        )
+        order_state.transition(self.order.pk, "confirmed")
+        self.assertTrue(self.order.assign_delivery_person())
+        self.assertEqual(self.status(), "out_for_delivery")
+        self.assertEqual(self.order.delivery_person_id, driver.pk)
+        driver.refresh_from_db()
+        self.assertFalse(driver.availability_status)
+
+        second = Order.objects.create(
+            user=self.customer, total_amount="500.00", delivery_address="Gujarat"
+        )
+        order_state.transition(second.pk, "confirmed")
+        self.assertFalse(second.assign_delivery_person())
+
+
+class OrderStatusApiTests(OrderTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.order = Order.objects.create(
+            user=self.customer, total_amount="500.00", delivery_address="Gujarat"
+        )
+        self.status_url = reverse("get_order_status_api", args=[self.order.pk])
+
+    def test_projected_read_then_cache(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.status_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], "pending")
+        self.assertNotIn('"total_amount"', queries[-1]["sql"])
+        with self.assertNumQueries(0):
+            self.client.get(self.status_url)
+
+    def test_transition_writes_through_and_changes_etag(self):
+        etag = self.client.get(self.status_url)["ETag"]
+        response = self.client.get(self.status_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            order_state.transition(self.order.pk, "confirmed")
+        response = self.client.get(self.status_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], "confirmed")
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_unknown_order(self):
+        url = reverse("get_order_status_api", args=[0])
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class OrderEventsTests(OrderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.order = Order.objects.create(
+            user=self.customer,
+            total_amount="500.00",
+            delivery_address="Gujarat",
+            order_status="confirmed",
+        )
+        self.headers = {"Authorization": self.client.defaults["HTTP_AUTHORIZATION"]}
+
+    async def open_stream(self):
+        response = await self.async_client.get(
+            reverse("order_events_api", args=[self.order.pk]), headers=self.headers
+        )
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        return aiter(response.streaming_content)
+
+    @override_settings(ORDER_EVENTS_HEARTBEAT=0.01)
+    async def test_stream_pushes_changes_until_delivered(self):
+        stream = await self.open_stream()
+        self.assertIn(b'"status":"confirmed"', await anext(stream))
+        self.assertEqual(await anext(stream), b": heartbeat\n\n")
+        events.publish_order_status(self.order.pk, "out_for_delivery", None)
+        self.assertIn(b'"status":"out_for_delivery"', await anext(stream))
+        events.publish_order_status(self.order.pk, "delivered", None)
+        self.assertIn(b'"status":"delivered"', await anext(stream))
+        with self.assertRaises(StopAsyncIteration):
+            await anext(stream)
+        self.assertFalse(events.get_hub()._subscribers)
+
+    @override_settings(ORDER_EVENTS_HUB="khanadotcom_app.events.CacheHub")
+    def test_transition_publishes_after_commit(self):
+        cache.clear()
+        channel = events.order_channel(self.order.pk)
+        subscription = async_to_sync(events.get_hub().subscribe)(channel)
+        with self.captureOnCommitCallbacks(execute=True):
+            order_state.transition(self.order.pk, "preparing")
+            self.assertIsNone(async_to_sync(subscription.get)(0))
+        message = async_to_sync(subscription.get)(0)
+        self.assertEqual(
+            (message["order_id"], message["status"]), (self.order.pk, "preparing")
+        )
+
+    def test_other_users_orders_are_not_streamed(self):
+        Order.objects.filter(pk=self.order.pk).update(user=self.restaurant.owner.user)
+        response = self.client.get(reverse("order_events_api", args=[self.order.pk]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_failed_lookup_unsubscribes(self):
+        with mock.patch("khanadotcom_app.views.Order") as order:
+            lookup = order.objects.filter.return_value.values.return_value
+            lookup.afirst.side_effect = DatabaseError
+            with self.assertRaises(DatabaseError):
+                self.client.get(reverse("order_events_api", args=[self.order.pk]))
+        self.assertFalse(events.get_hub()._subscribers)
+
+
+class RestaurantOrderQueueTests(OrderTestCase):
+    def setUp(self):
+        super().setUp()
+        owner = self.restaurant.owner.user
+        owner.is_active = True
+        owner.save()
+        token = RefreshToken.for_user(owner).access_token
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.queue_url = reverse(
+            "restaurant_orders_api", args=[self.restaurant.restaurant_id]
+        )
+
+    def place(self):
+        return place_order(
+            self.customer, self.restaurant.restaurant_id, self.cart(self.items[:2])
+        )
+
+    def test_queue_lists_new_orders_oldest_first(self):
+        first, second = self.place(), self.place()
+        response = self.client.get(self.queue_url, headers=self.headers)
+        self.assertEqual(
+            [order["order_id"] for order in response.json()], [first.pk, second.pk]
+        )
+        self.assertEqual(response.json()[0]["order_status"], "pending")
+        self.assertEqual(response.json()[0]["items"][0]["menu_item_name"], "Dish 0")
+        cursor = response["X-Next-Cursor"]
+        response = self.client.get(
+            self.queue_url, {"cursor": cursor}, headers=self.headers
+        )
+        self.assertEqual(response.json(), [])
+        self.assertEqual(response["X-Next-Cursor"], cursor)
+        third = self.place()
+        response = self.client.get(
+            self.queue_url, {"cursor": cursor}, headers=self.headers
+        )
+        self.assertEqual([order["order_id"] for order in response.json()], [third.pk])
+
+    def test_only_the_owner_sees_the_queue(self):
+        self.assertEqual(self.client.get(self.queue_url).status_code, 404)
+        response = self.client.get(
+            self.queue_url, {"wait": "600"}, headers=self.headers
+        )
+        self.assertEqual(response.status_code, 400)
+
+    async def test_long_poll_returns_when_an_order_arrives(self):
+        response = await self.async_client.get(self.queue_url, headers=self.headers)
+        self.assertEqual(response.json(), [])
+        waiting = asyncio.ensure_future(
+            self.async_client.get(self.queue_url, {"wait": "5"}, headers=self.headers)
+        )
+        await asyncio.sleep(0.05)
+        self.assertFalse(waiting.done())
+        order = await sync_to_async(self.place)()
+        events.publish_new_order(self.restaurant.restaurant_id, order)
+        response = await asyncio.wait_for(waiting, 5)
+        self.assertEqual([row["order_id"] for row in response.json()], [order.pk])
+
+
+class DispatchTests(OrderTestCase):
+    def setUp(self):
+        super().setUp()
+        metrics.reset()
+        self.orders = [
+            Order.objects.create(
+                user=self.customer,
+                total_amount="500.00",
+                delivery_address="Gujarat",
+                order_status="confirmed",
+            )
+            for _ in range(3)
+        ]
+        self.drivers = [
+            DeliveryPerson.objects.create(
+                user=self.customer, aadhaar_card_number=f"99998888777{i}"
+            )
+            for i in range(2)
+        ]
+
+    def test_batch_assigns_distinct_drivers_in_one_pass(self):
+        with self.assertNumQueries(6):  # savepoint, 2 locks, 2 updates, release
+            pairs = dispatch.assign_batch()
+        self.assertEqual(
+            pairs,
+            [
+                (self.orders[0].pk, self.drivers[0].pk),
+                (self.orders[1].pk, self.drivers[1].pk),
+            ],
+        )
+        statuses = dict(Order.objects.values_list("pk", "order_status"))
+        self.assertEqual(statuses[self.orders[2].pk], "confirmed")
+        self.assertFalse(
+            DeliveryPerson.objects.filter(availability_status=True).exists()
+        )
+        self.assertEqual(dispatch.report()["unassigned"], 1)
+
+    def test_single_assignment_and_stats(self):
+        self.assertEqual(dispatch.assign_order(self.orders[0].pk), self.drivers[0].pk)
+        with self.assertRaises(order_state.InvalidTransition):
+            dispatch.assign_order(self.orders[0].pk)
+        # The losing attempt released its driver.
+        self.assertEqual(dispatch.assign_order(self.orders[1].pk), self.drivers[1].pk)
+        self.assertIsNone(dispatch.assign_order(self.orders[2].pk))
+        report = dispatch.report()
+        self.assertEqual(
+            (report["runs"], report["assigned"], report["conflicts"]), (4, 2, 1)
+        )
+
+    def test_solver_finds_the_cheapest_matching(self):
+        cost = [[4, 1, 3, 9], [2, 0, 5, 9], [3, 2, 2, 9]]
+        pairs = dispatch_optimizer.solve(cost)
+        best = min(
+            sum(row[column] for row, column in zip(cost, columns))
+            for columns in itertools.permutations(range(4), 3)
+        )
+        self.assertEqual(sum(cost[row][column] for row, column in pairs), best)
+        self.assertEqual(pairs, [(0, 1), (1, 0), (2, 2)])
+        # More rows than columns leaves the costliest rows out.
+        transposed = [list(column) for column in zip(*cost)]
+        self.assertEqual(dispatch_optimizer.solve(transposed), [(0, 1), (1, 0), (2, 2)])
+
+    def test_optimal_batch_sends_the_nearest_driver(self):
+        Restaurant.objects.filter(pk=self.restaurant.pk).update(
+            latitude="23.022500", longitude="72.571400"
+        )
+        Order.objects.filter(pk=self.orders[0].pk).update(restaurant=self.restaurant)
+        DeliveryPerson.objects.filter(pk=self.drivers[0].pk).update(
+            latitude="23.100000", longitude="72.600000"
+        )
+        DeliveryPerson.objects.filter(pk=self.drivers[1].pk).update(
+            latitude="23.023000", longitude="72.572000"
+        )
+        Order.objects.filter(pk__in=[o.pk for o in self.orders[1:]]).update(
+            order_status="pending"
+        )
+        pairs = dispatch.assign_batch(
+            match=dispatch_optimizer.optimal_pairs, candidates=10
+        )
+        self.assertEqual(pairs, [(self.orders[0].pk, self.drivers[1].pk)])
+        # The driver weighed but not picked is free again.
+        self.assertTrue(
+            DeliveryPerson.objects.get(pk=self.drivers[0].pk).availability_status
+        )
@@ -0,0 +1,131 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .metrics import metrics
+from .models import FailedLoginAttempt
+
+# Login throttling in the shared cache.
+#
+# Failed logins are counted per email and per client IP in a sliding window
+# of LOGIN_THROTTLE_WINDOW seconds, approximated from two fixed buckets: the
+# current one in full, the previous one weighted by how much of it still
+# falls inside the window. Once either count reaches its limit, attempts are
+# refused before the password is hashed or the database is touched.
+#
+# Failures since the last successful login are counted per email in the
+# cache too, so a failed login writes nothing to the database. The count
+# reaches the FailedLoginAttempt row once, when it hits RESET_EMAIL_AFTER and
+# the password reset email goes out; later failures are answered from a
+# cache flag. A successful login clears both, and deletes the row if one was
+# written.
+
+RESET_EMAIL_AFTER = 5
+
+WINDOW_KEY = "login:{}:{}:{}"  # scope, digest, bucket
+FAILURES_KEY = "login:failures:{}"
+RESET_SENT_KEY = "login:reset-sent:{}"
+FAILURES_TTL = 24 * 60 * 60
+
+
+def _digest(value):
+    # Emails may hold characters cache backends refuse in keys.
+    return hashlib.sha256((value or "").strip().lower().encode()).hexdigest()
+
+
+def client_ip(request):
+    # Each trusted proxy appends the address it got the request from, so the
+    # client is LOGIN_TRUSTED_PROXIES entries from the right. Anything left
+    # of that came from the client and can be forged.
+    proxies = settings.LOGIN_TRUSTED_PROXIES
+    if proxies:
+        forwarded = [
+            address.strip()
+            for address in request.META.get("HTTP_X_FORWARDED_FOR", "").split(",")
+            if address.strip()
+        ]
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies]
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def _incr(key, timeout):
+    cache.add(key, 0, timeout)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Expired between the add and the incr.
+        cache.set(key, 1, timeout)
+        return 1
+
+
+def _limits():
+    return (
+        ("email", settings.LOGIN_THROTTLE_EMAIL_LIMIT),
+        ("ip", settings.LOGIN_THROTTLE_IP_LIMIT),
+    )
+
+
+def throttled(email, ip, now=None):
+    # Seconds to wait before the next attempt, or None if it may go ahead.
+    window = settings.LOGIN_THROTTLE_WINDOW
+    now = time.time() if now is None else now
+    bucket, elapsed = divmod(now, window)
+    bucket = int(bucket)
+    digests = {"email": _digest(email), "ip": _digest(ip)}
+    keys = {
+        scope: (
+            WINDOW_KEY.format(scope, digests[scope], bucket),
+            WINDOW_KEY.format(scope, digests[scope], bucket - 1),
+        )
+        for scope, _ in _limits()
+    }
+    counts = cache.get_many([key for pair in keys.values() for key in pair])
+    for scope, limit in _limits():
+        current, previous = keys[scope]
+        weight = 1 - elapsed / window
+        if counts.get(current, 0) + counts.get(previous, 0) * weight >= limit:
+            metrics.incr(f"login.throttled.{scope}")
+            return int(window - elapsed) + 1
+    return None
+
+
+def login_failed(email, ip, now=None):
+    # Records a failed attempt and returns the failures for ``email`` since
+    # its last successful login.
+    window = settings.LOGIN_THROTTLE_WINDOW
+    now = time.time() if now is None else now
+    bucket = int(now // window)
+    _incr(WINDOW_KEY.format("email", _digest(email), bucket), 2 * window)
+    _incr(WINDOW_KEY.format("ip", _digest(ip), bucket), 2 * window)
+    metrics.incr("login.failures")
+    return _incr(FAILURES_KEY.format(_digest(email)), FAILURES_TTL)
+
+
+def reset_email_due(email, user, failures):
+    # Writes the failure count and marks the reset email as sent.
+    FailedLoginAttempt.objects.update_or_create(
+        user=user,
+        defaults={"attempt_count": failures, "timestamp": timezone.now()},
+    )
+    cache.set(RESET_SENT_KEY.format(_digest(email)), 1, FAILURES_TTL)
+    metrics.incr("login.reset_emails")
+
+
+def reset_email_sent(email):
+    return bool(cache.get(RESET_SENT_KEY.format(_digest(email))))
+
+
+def login_succeeded(email, user):
+    digest = _digest(email)
+    keys = [FAILURES_KEY.format(digest), RESET_SENT_KEY.format(digest)]
+    recorded = cache.get_many(keys)
+    if not recorded:
+        # Nothing recorded since the last successful login.
+        return
+    cache.delete_many(keys)
+    if RESET_SENT_KEY.format(digest) in recorded:
+        FailedLoginAttempt.objects.filter(user=user).delete()
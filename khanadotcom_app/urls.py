@@ -37,6 +37,11 @@ urlpatterns = [
     path("add-menu-items/", views.add_menu_item_api, name="add_menu_item"),
     path("delete-user/<int:user_id>/", views.delete_user_api, name="delete_user_api"),
     path("api/restaurants/", views.restaurant_list_api, name="restaurant_list_api"),
+    path(
+        "api/restaurants/nearby/",
+        views.nearby_restaurants_api,
+        name="nearby_restaurants_api",
+    ),
     path(
         "api/restaurants/<int:restaurant_id>/",
         views.restaurant_detail_api,
@@ -52,11 +57,24 @@ urlpatterns = [
         views.menu_items_api,
         name="menu_items_api",
     ),
+    path("api/categories/", views.categories_api, name="categories_api"),
+    path(
+        "api/categories/<int:category_id>/items/",
+        views.category_items_api,
+        name="category_items_api",
+    ),
+    path("api/search/", views.search_api, name="search_api"),
+    path("api/metrics/", views.metrics_api, name="metrics_api"),
     path(
         "restaurants/<int:restaurant_id>/order/",
         views.order_placement_api,
         name="order_placement_api",
     ),
+    path(
+        "restaurants/<int:restaurant_id>/orders/",
+        views.restaurant_orders_api,
+        name="restaurant_orders_api",
+    ),
     path(
         "order/<int:order_id>/",
         views.confirm_order,
@@ -67,6 +85,11 @@ urlpatterns = [
         views.get_order_status_api,
         name="get_order_status_api",
     ),
+    path(
+        "order/<int:order_id>/events/",
+        views.order_events_api,
+        name="order_events_api",
+    ),
     path(
         "order/<int:order_id>/prepare/",
         views.update_order_status_to_preparing,
@@ -1,29 +1,73 @@
+from django.conf import settings
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET
 from django.contrib.auth import authenticate, login, logout, get_user_model
 from django.shortcuts import get_object_or_404
 from django.utils.encoding import force_bytes, force_str
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.db import transaction
+from asgiref.sync import sync_to_async
 from .tokens import account_activation_token
 from stdnum.in_ import aadhaar
+import asyncio
 import json
 from rest_framework.response import Response
 from rest_framework.decorators import api_view
 from rest_framework import status
 from django.contrib.sites.shortcuts import get_current_site
-from django.core.mail import EmailMessage
 from django.template.loader import render_to_string
 from django.contrib.auth.tokens import default_token_generator
 from django.db.models.query_utils import Q
+from django.db.models import F, Prefetch
 from django.utils import timezone
 from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.decorators import permission_classes
 from .serializers import (
     OrderSerializer,
+    RestaurantOrderSerializer,
 )
+from . import (
+    authentication,
+    catalog_cache,
+    compression,
+    dispatch,
+    events,
+    order_state,
+    outbox,
+    throttling,
+)
+from .catalog import (
+    MENU_ITEM_FIELDS,
+    RESTAURANT_DETAIL_FIELDS,
+    RESTAURANT_FIELDS,
+    columns_for,
+    menu_item_values,
+    menu_snapshot,
+    restaurant_values,
+    serialize_menu_item,
+    serialize_restaurant,
+    serialize_restaurant_detail,
+)
+from .conditional import Validators, catalog_validators, make_etag, not_modified
+from .fieldsets import is_sparse, requested_fields
+from .geo import nearby_restaurants, parse_coordinates
+from .idempotency import idempotent
+from .metrics import metrics
+from .orders import place_order
+from .pagination import (
+    decode_cursor,
+    encode_cursor,
+    keyset_filter,
+    keyset_page,
+    ordering_columns,
+    page_size,
+    paginated_response,
+)
+from .public import public
+from .search import catalog_search
 import re
 from .models import (
     RestaurantOwner,
@@ -34,10 +78,10 @@ from .models import (
     MenuItem,
     Restaurant,
     CustomerDetail,
-    FailedLoginAttempt,
-    EmailsLogs,
     ContactMessage,
     Review,
+    Category,
+    RestaurantCategoryCount,
 )
 
 
@@ -66,6 +110,7 @@ def validate_password(password):
     return True
 
 
+@public
 @csrf_exempt
 @api_view(["POST"])
 def signup_api(request):
@@ -166,6 +211,7 @@ from datetime import datetime
 from rest_framework_simplejwt.tokens import AccessToken
 
 
+@public
 @csrf_exempt
 @api_view(["POST"])
 def login_api(request):
@@ -173,11 +219,21 @@ def login_api(request):
         username = request.data.get("email")
         password = request.data.get("password")
 
+        # Refuse throttled attempts before the password is hashed
+        ip = throttling.client_ip(request)
+        wait = throttling.throttled(username, ip)
+        if wait is not None:
+            return Response(
+                {"error": "Too many login attempts. Please try again later."},
+                status=status.HTTP_429_TOO_MANY_REQUESTS,
+                headers={"Retry-After": str(wait)},
+            )
+
         # Authenticate the user
         user = authenticate(username=username, password=password)
         if user is not None:
             # Reset failed login attempts on successful login
-            FailedLoginAttempt.objects.filter(user=user).delete()
+            throttling.login_succeeded(username, user)
             login(request, user)
 
             # Check if the existing token is valid
@@ -221,23 +277,21 @@ def login_api(request):
 
         else:
             # Handle failed login attempts
-            user = User.objects.filter(email=username).first()
-            if user:
-                failed_attempt, created = FailedLoginAttempt.objects.get_or_create(
-                    user=user
-                )
-                failed_attempt.attempt_count += 1
-                failed_attempt.timestamp = timezone.now()
-                failed_attempt.save()
-
-                if failed_attempt.attempt_count >= 5:
+            failures = throttling.login_failed(username, ip)
+            if failures == throttling.RESET_EMAIL_AFTER:
+                user = User.objects.filter(email=username).first()
+                if user:
+                    throttling.reset_email_due(username, user, failures)
                     send_password_reset_email(request, user)
-                    return Response(
-                        {
-                            "error": "Too many failed login attempts. Password reset email has been sent."
-                        },
-                        status=status.HTTP_403_FORBIDDEN,
-                    )
+            # Answered from the cache after the email went out
+            reset_sent = failures >= throttling.RESET_EMAIL_AFTER
+            if reset_sent and throttling.reset_email_sent(username):
+                return Response(
+                    {
+                        "error": "Too many failed login attempts. Password reset email has been sent."
+                    },
+                    status=status.HTTP_403_FORBIDDEN,
+                )
 
             return Response(
                 {"error": "Invalid username or password."},
@@ -258,6 +312,7 @@ def logout_api(request):
         return Response({"error": "Network Error"}, status=status.HTTP_400_BAD_REQUEST)
 
 
+@public
 @api_view(["GET"])
 def activate_api(request, uidb64, token):
     try:
@@ -290,18 +345,8 @@ def send_activation_email(request, user):
             },
         )
         to_email = user.email
-        email = EmailMessage(mail_subject, message, to=[to_email])
-        email.send()
-
-        # Log email in EmailsLogs table
-        EmailsLogs.objects.create(
-            subject=mail_subject,
-            message=message,
-            recipient=to_email,
-            sent_date=timezone.now(),
-            added_by=user,
-            is_otp=0,
-        )
+        # Sent by the send_outbox command
+        outbox.enqueue(mail_subject, message, to_email, user, request)
 
     except Exception as e:
         # Handle exceptions or errors here, such as logging them or notifying admins
@@ -369,6 +414,7 @@ def change_pass_api(request):
 
 
 # @permission_classes([IsAuthenticated])
+@public
 @api_view(["GET"])
 def owner_profile_api(request):
     user = request.user
@@ -453,79 +499,285 @@ def user_profile_api(request):
     return Response(data, status=status.HTTP_200_OK)
 
 
+RESTAURANT_SORTS = {
+    "id": ("restaurant_id",),
+    "rating": ("-rating", "-restaurant_id"),
+}
+
+MENU_ITEM_SORTS = {
+    "id": ("menu_item_id",),
+    "rating": ("-rating", "-menu_item_id"),
+}
+
+ORDER_HISTORY_SORTS = {
+    "newest": ("-order_date", "-order_id"),
+}
+
+
+@public
 @api_view(["GET"])
 def restaurant_list_api(request):
-    restaurants = Restaurant.objects.all()
-    data = [
-        {
-            "id": restaurant.restaurant_id,
-            "name": restaurant.name,
-            "image": restaurant.profile_pic.url,
-            "rating": restaurant.rating,
-            "description": restaurant.description,
-        }
-        for restaurant in restaurants
-    ]
-    return Response(data)
+    validators = catalog_validators(
+        "restaurants", request.GET, Restaurant.objects.all()
+    )
+    response = not_modified(request, validators)
+    if response is not None:
+        return validators.apply(response)
+
+    def build():
+        fields = requested_fields(request, RESTAURANT_FIELDS)
+        rows, cursor = keyset_page(
+            request,
+            restaurant_values(
+                Restaurant.objects.all(), fields, ordering_columns(RESTAURANT_SORTS)
+            ),
+            RESTAURANT_SORTS,
+            default_sort="id",
+        )
+        return [serialize_restaurant(row, fields) for row in rows], cursor
+
+    try:
+        data, cursor = catalog_cache.read("restaurants", request.GET, build)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return validators.apply(paginated_response(request, Response(data), cursor))
 
 
+@public
 @api_view(["GET"])
 def restaurant_detail_api(request, restaurant_id):
-    restaurant = get_object_or_404(Restaurant, pk=restaurant_id)
-    data = {
-        "id": restaurant.restaurant_id,
-        "name": restaurant.name,
-        "rating": restaurant.rating,
-        "description": restaurant.description,
-        "image": restaurant.profile_pic.url,
-        "address": restaurant.address,
-        "phone_number": restaurant.phone_number,
-        "email": restaurant.email,
-        "restaurant_GST": restaurant.restaurant_GST,
-    }
-    return Response(data)
+    scope = f"restaurant:{restaurant_id}"
+    validators = catalog_validators(
+        scope, request.GET, Restaurant.objects.filter(pk=restaurant_id)
+    )
+    response = not_modified(request, validators)
+    if response is not None:
+        return validators.apply(response)
+
+    def build():
+        fields = requested_fields(request, RESTAURANT_DETAIL_FIELDS)
+        row = (
+            Restaurant.objects.filter(pk=restaurant_id)
+            .values(*columns_for(RESTAURANT_DETAIL_FIELDS, fields))
+            .first()
+        )
+        if row is None:
+            raise Http404("No Restaurant matches the given query.")
+        return serialize_restaurant_detail(row, fields)
 
+    try:
+        data = catalog_cache.read(scope, request.GET, build)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return validators.apply(Response(data))
 
+
+@public
 @api_view(["GET"])
 def menu_items_api_by_restaurant(request, restaurant_id):
-    menu_items = MenuItem.objects.filter(restaurant_id=restaurant_id)
-    data = [
-        {
-            "id": item.menu_item_id,
-            "name": item.name,
-            "restaurant": item.restaurant.name,
-            "restaurant_id": item.restaurant.restaurant_id,
-            "price": item.price,
-            "description": item.description,
-            "image": item.menu_item_pic.url,
-            "availability": item.availability,
-            "rating": item.rating,
-            "preparation_time": item.preparation_time,
-        }
-        for item in menu_items
-    ]
-    return Response(data)
+    snapshot = menu_snapshot(restaurant_id)
+    if not is_sparse(request):
+        response = not_modified(request, snapshot.validators)
+        if response is None:
+            response = HttpResponse(snapshot.body, content_type="application/json")
+        return snapshot.validators.apply(response)
+
+    # A subset of the columns: cheaper to select than the full snapshot but
+    # not worth a snapshot of its own, it goes through the catalog cache.
+    validators = Validators(
+        make_etag(snapshot.validators.etag, catalog_cache.variant_key(request.GET)),
+        snapshot.validators.last_modified,
+    )
+    response = not_modified(request, validators)
+    if response is not None:
+        return validators.apply(response)
 
+    def build():
+        fields = requested_fields(request, MENU_ITEM_FIELDS)
+        rows = menu_item_values(
+            MenuItem.objects.filter(restaurant_id=restaurant_id), fields
+        ).order_by("menu_item_id")
+        return [serialize_menu_item(row, fields) for row in rows]
 
+    try:
+        data = catalog_cache.read(f"menu:{restaurant_id}", request.GET, build)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return validators.apply(Response(data))
+
+
+@public
 @api_view(["GET"])
 def menu_items_api(request):
-    menu_items = MenuItem.objects.all()
-    data = [
+    validators = catalog_validators(
+        "menu",
+        request.GET,
+        MenuItem.objects.all(),
+        "updated_at",
+        "restaurant__updated_at",
+    )
+    response = not_modified(request, validators)
+    if response is not None:
+        return validators.apply(response)
+
+    try:
+        fields = requested_fields(request, MENU_ITEM_FIELDS)
+        rows, cursor = keyset_page(
+            request,
+            menu_item_values(
+                MenuItem.objects.all(), fields, ordering_columns(MENU_ITEM_SORTS)
+            ),
+            MENU_ITEM_SORTS,
+            default_sort="id",
+        )
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    data = [serialize_menu_item(row, fields) for row in rows]
+    return validators.apply(paginated_response(request, Response(data), cursor))
+
+
+@public
+@api_view(["GET"])
+def categories_api(request):
+    # Facet counts come from the counter columns maintained by facets.py,
+    # never from a GROUP BY over the menu.
+    restaurant_id = request.query_params.get("restaurant_id")
+    if restaurant_id is not None and not restaurant_id.isdigit():
+        return Response(
+            {"error": "restaurant_id must be an integer."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    def build():
+        if restaurant_id is None:
+            rows = Category.objects.values(
+                "category_id", "name", "description", "item_count"
+            ).order_by("name", "category_id")
+        else:
+            rows = (
+                RestaurantCategoryCount.objects.filter(
+                    restaurant_id=restaurant_id, item_count__gt=0
+                )
+                .values(
+                    "category_id",
+                    "item_count",
+                    name=F("category__name"),
+                    description=F("category__description"),
+                )
+                .order_by("name", "category_id")
+            )
+        return [
+            {
+                "id": row["category_id"],
+                "name": row["name"],
+                "description": row["description"],
+                "item_count": row["item_count"],
+            }
+            for row in rows
+        ]
+
+    return Response(catalog_cache.read("categories", request.GET, build))
+
+
+@public
+@api_view(["GET"])
+def category_items_api(request, category_id):
+    if not Category.objects.filter(pk=category_id).exists():
+        return Response(
+            {"error": "Category not found."}, status=status.HTTP_404_NOT_FOUND
+        )
+    menu_items = MenuItem.objects.filter(menuitemcategory__category_id=category_id)
+    restaurant_id = request.query_params.get("restaurant_id")
+    try:
+        if restaurant_id is not None:
+            if not restaurant_id.isdigit():
+                raise ValueError("restaurant_id must be an integer.")
+            menu_items = menu_items.filter(restaurant_id=restaurant_id)
+        fields = requested_fields(request, MENU_ITEM_FIELDS)
+        rows, cursor = keyset_page(
+            request,
+            menu_item_values(menu_items, fields, ordering_columns(MENU_ITEM_SORTS)),
+            MENU_ITEM_SORTS,
+            default_sort="id",
+        )
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    data = [serialize_menu_item(row, fields) for row in rows]
+    return paginated_response(request, Response(data), cursor)
+
+
+@public
+@api_view(["GET"])
+def search_api(request):
+    query = request.query_params.get("q", "").strip()
+    doc_type = request.query_params.get("type")
+    if not query:
+        return Response(
+            {"error": "Query parameter 'q' is required."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    if doc_type not in (None, "menu_item", "restaurant"):
+        return Response(
+            {"error": "Invalid type. Choose one of: menu_item, restaurant."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    try:
+        limit = page_size(request)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    results = catalog_search.search(query, limit=limit, doc_type=doc_type)
+    return Response(results)
+
+
+@public
+@api_view(["GET"])
+def nearby_restaurants_api(request):
+    params = request.query_params
+    try:
+        lat, lng = parse_coordinates(params.get("lat"), params.get("lng"))
+        if lat is None and request.user.is_authenticated:
+            # Fall back to the customer's saved address.
+            lat, lng = parse_coordinates(
+                request.user.latitude, request.user.longitude
+            )
+        if lat is None:
+            raise ValueError("Query parameters 'lat' and 'lng' are required.")
+        radius_km = float(
+            params.get("radius_km", settings.NEARBY_DEFAULT_RADIUS_KM)
+        )
+        if not 0 < radius_km <= settings.NEARBY_MAX_RADIUS_KM:
+            raise ValueError(
+                f"radius_km must be between 0 and {settings.NEARBY_MAX_RADIUS_KM}."
+            )
+        limit = page_size(request)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    sort = params.get("sort", "distance")
+    if sort not in ("distance", "rating"):
+        return Response(
+            {"error": "Invalid sort. Choose one of: distance, rating."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    results = nearby_restaurants.nearest(lat, lng, radius_km, limit)
+    if sort == "rating":
+        results.sort(key=lambda hit: (-hit["rating"], hit["distance_km"]))
+    return Response(results)
+
+
+@public
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def metrics_api(request):
+    return Response(
         {
-            "id": item.menu_item_id,
-            "name": item.name,
-            "restaurant": item.restaurant.name,
-            "restaurant_id": item.restaurant.restaurant_id,
-            "price": item.price,
-            "description": item.description,
-            "image": item.menu_item_pic.url,
-            "availability": item.availability,
-            "rating": item.rating,
-            "preparation_time": item.preparation_time,
+            "authentication": authentication.report(),
+            "compression": compression.report(),
+            "dispatch": dispatch.report(),
+            "outbox": outbox.report(),
+            "counters": metrics.snapshot(),
         }
-        for item in menu_items
-    ]
-    return Response(data)
+    )
 
 
 # Basic api ends
@@ -640,6 +892,13 @@ def update_user_profile_api(request):
         "phone_number": request.data.get("phone_number", user.phone_number),
         "address": request.data.get("address", user.address),
     }
+    if "latitude" in request.data or "longitude" in request.data:
+        try:
+            user_data["latitude"], user_data["longitude"] = parse_coordinates(
+                request.data.get("latitude"), request.data.get("longitude")
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
     # Update user information
     for attr, value in user_data.items():
@@ -656,6 +915,7 @@ def update_user_profile_api(request):
 # Delete api  Starts
 
 
+@public
 @api_view(["DELETE"])
 def delete_user_api(request, user_id):
     try:
@@ -699,6 +959,7 @@ def delete_user_api(request, user_id):
 #  reset password api start
 
 
+@public
 @api_view(["POST"])
 def request_password_reset(request):
     data = request.data
@@ -738,10 +999,11 @@ def send_password_reset_email(request, user):
         },
     )
     to_email = user.email
-    email = EmailMessage(mail_subject, message, to=[to_email])
-    email.send()
+    # Sent by the send_outbox command
+    outbox.enqueue(mail_subject, message, to_email, user, request)
 
 
+@public
 @api_view(["GET", "POST"])
 def password_reset_confirm(request, uidb64, token):
     try:
@@ -798,6 +1060,7 @@ def password_reset_confirm(request, uidb64, token):
 # contact us start
 
 
+@public
 @api_view(["POST"])
 def contact_us(request):
     if request.method == "POST":
@@ -840,56 +1103,20 @@ def contact_us(request):
 
 @permission_classes([IsAuthenticated])
 @api_view(["POST"])
+@idempotent
 # @permission_classes([IsAuthenticated])
 def order_placement_api(request, restaurant_id):
-    restaurant = get_object_or_404(Restaurant, pk=restaurant_id)
     user = request.user
     if request.method == "POST":
-        data = request.data
-
-        # Extract data from request body
-        delivery_address = user.address
-        items = data.get("items", [])
-
-        # Validate data presence
-        if not (items):
-            return Response(
-                {"error": "items are required fields."},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-
-        # Create Order object
-        order = Order.objects.create(
-            user=user,
-            delivery_address=delivery_address,
-            total_amount=0,
-        )
-
-        # Process each selected menu item
-        total_amount = 0
-
-        for item in items:
-            menu_item = get_object_or_404(MenuItem, pk=item["item_id"])
-            quantity = item["quantity"]
-            OrderItem.objects.create(
-                order=order,
-                menu_item=menu_item,
-                quantity=quantity,
-                price=menu_item.price,
+        try:
+            order = place_order(
+                user,
+                restaurant_id,
+                request.data.get("items", []),
+                coupon_code=request.data.get("coupon_code"),
             )
-            total_amount += menu_item.price
-
-        # Update total_amount in the Order model
-        order.total_amount = total_amount
-        order.save()
-
-        # Create Payment object (example: cash on delivery)
-        payment = Payment.objects.create(
-            order=order,
-            payment_method="cash_on_delivery",
-            amount=total_amount,
-            payment_status="pending",  # Adjust based on actual payment flow
-        )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         # notify_restaurant_owner(order)
 
         # Return JSON response with order confirmation details
@@ -897,8 +1124,9 @@ def order_placement_api(request, restaurant_id):
             {
                 "success": "Order placed successfully.",
                 "user_id": user.user_id,
-                "restaurant_id": restaurant.restaurant_id,
+                "restaurant_id": restaurant_id,
                 "order_id": order.order_id,
+                "discount_amount": order.discount_amount,
                 "total_amount": order.total_amount,
             },
             status=status.HTTP_201_CREATED,
@@ -923,8 +1151,6 @@ def confirm_order(request, order_id):
             status=status.HTTP_403_FORBIDDEN,
         )
 
-    # Get the order object
-    order = get_object_or_404(Order, pk=order_id)
     status_update = request.data.get("status")
 
     if status_update not in ["confirmed", "rejected"]:
@@ -935,13 +1161,14 @@ def confirm_order(request, order_id):
             status=status.HTTP_400_BAD_REQUEST,
         )
 
-    # Update the order status
-    order.order_status = status_update
-    if status_update == "rejected":
-        order.order_status = "cancelled"
-        order.is_deleted = True
-
-    order.save()
+    # Update the order status, a rejected order is cancelled
+    target = "confirmed" if status_update == "confirmed" else "cancelled"
+    try:
+        order_state.transition(order_id, target, expected="pending")
+    except Order.DoesNotExist:
+        return Response({"error": "Order not found."}, status=status.HTTP_404_NOT_FOUND)
+    except order_state.InvalidTransition as e:
+        return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
 
     return Response(
         {"success": f"Order has been {status_update}."},
@@ -955,20 +1182,137 @@ def confirm_order(request, order_id):
 @permission_classes([IsAuthenticated])
 @api_view(["GET"])
 def get_order_status_api(request, order_id):
-    try:
-        order = get_object_or_404(Order, pk=order_id)
-        order_status = {
-            "order_id": order.id,
-            "status": order.status,
-        }
-        return Response(order_status, status=status.HTTP_200_OK)
-    except Order.DoesNotExist:
+    # Polled every few seconds per active order: the status comes from the
+    # write-through status cache and an unchanged status is a bodiless 304.
+    order = order_state.current_status(order_id)
+    if order is None:
         return Response({"error": "Order not found."}, status=status.HTTP_404_NOT_FOUND)
-    except Exception as e:
-        return Response(
-            {"error": f"Internal Server Error: {str(e)}"},
-            status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+    updated_at = order["updated_at"]
+    last_modified = int(updated_at.timestamp()) if updated_at else None
+    validators = Validators(
+        make_etag(order["order_id"], order["status"], last_modified), last_modified
+    )
+    response = not_modified(request, validators)
+    if response is None:
+        response = Response(order, status=status.HTTP_200_OK)
+    return validators.apply(response)
+
+
+@require_GET
+async def order_events_api(request, order_id):
+    # Live status of one of the user's orders as Server-Sent Events, so
+    # clients stop polling get_order_status_api. The user comes from
+    # TokenMiddleware. Subscribing before reading the current status means
+    # no change can slip in between the two.
+    subscription = await events.get_hub().subscribe(events.order_channel(order_id))
+    try:
+        order = (
+            await Order.objects.filter(pk=order_id, user_id=request.UserData.pk)
+            .values("order_status", "updated_at")
+            .afirst()
         )
+    except BaseException:
+        # Includes the client going away while we wait for the database.
+        subscription.close()
+        raise
+    if order is None:
+        subscription.close()
+        return JsonResponse({"error": "Order not found."}, status=404)
+    current = events.status_message(
+        order_id, order["order_status"], order["updated_at"]
+    )
+    return StreamingHttpResponse(
+        events.order_status_stream(subscription, current),
+        content_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+ORDER_QUEUE_ORDERING = ("created_at", "order_id")
+ORDER_QUEUE_STATUSES = ("pending", "confirmed", "preparing")
+
+
+def _order_queue_params(request):
+    statuses = request.GET.get("status")
+    statuses = statuses.split(",") if statuses else ORDER_QUEUE_STATUSES
+    unknown = sorted(set(statuses) - set(order_state.STATUSES))
+    if unknown:
+        raise ValueError("Unknown status: " + ", ".join(unknown) + ".")
+    try:
+        wait = float(request.GET.get("wait", 0))
+    except ValueError:
+        raise ValueError("wait must be a number of seconds.")
+    if not 0 <= wait <= settings.ORDER_QUEUE_MAX_WAIT:
+        raise ValueError(
+            f"wait must be between 0 and {settings.ORDER_QUEUE_MAX_WAIT:g} seconds."
+        )
+    cursor = request.GET.get("cursor")
+    after = (
+        decode_cursor(cursor, "queue", ORDER_QUEUE_ORDERING, Order) if cursor else None
+    )
+    return statuses, wait, after, page_size(request)
+
+
+def _order_queue(restaurant_id, statuses, after, limit):
+    # Oldest first, on the (restaurant, order_status, created_at) index.
+    orders = Order.objects.filter(
+        restaurant_id=restaurant_id, order_status__in=statuses
+    )
+    if after is not None:
+        orders = orders.filter(keyset_filter(ORDER_QUEUE_ORDERING, after))
+    orders = orders.order_by(*ORDER_QUEUE_ORDERING).prefetch_related(
+        Prefetch(
+            "orderitem_set",
+            queryset=OrderItem.objects.select_related("menu_item").order_by("pk"),
+        )
+    )[:limit]
+    orders = list(orders)
+    last = [str(orders[-1].created_at), str(orders[-1].order_id)] if orders else None
+    return RestaurantOrderSerializer(orders, many=True).data, last
+
+
+@require_GET
+async def restaurant_orders_api(request, restaurant_id):
+    # Incoming order queue for the restaurant's owner, oldest first. The
+    # X-Next-Cursor header marks the newest order returned; passing it back
+    # as ``cursor`` asks for newer orders only, and with ``wait`` the
+    # request is held until one arrives (long-poll) instead of the kitchen
+    # polling in a tight loop. The user comes from TokenMiddleware.
+    owns = await Restaurant.objects.filter(
+        pk=restaurant_id, owner__user_id=request.UserData.pk
+    ).aexists()
+    if not owns:
+        return JsonResponse({"error": "Restaurant not found."}, status=404)
+    try:
+        statuses, wait, after, limit = _order_queue_params(request)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    subscription = None
+    if wait:
+        # Subscribe before the first read so no new order slips in between.
+        subscription = await events.get_hub().subscribe(
+            events.restaurant_channel(restaurant_id)
+        )
+    try:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + wait
+        while True:
+            data, last = await sync_to_async(_order_queue)(
+                restaurant_id, statuses, after, limit
+            )
+            remaining = deadline - loop.time()
+            if data or remaining <= 0 or not await subscription.get(remaining):
+                break
+    finally:
+        if subscription is not None:
+            subscription.close()
+
+    response = JsonResponse(data, safe=False)
+    cursor = encode_cursor("queue", last) if last else request.GET.get("cursor")
+    if cursor:
+        response["X-Next-Cursor"] = cursor
+    return response
 
 
 @permission_classes([IsAuthenticated])
@@ -983,14 +1327,14 @@ def update_order_status_to_preparing(request, order_id):
                 {"error": "Only restaurant owners can Start preparing the dish."},
                 status=status.HTTP_403_FORBIDDEN,
             )
-        order = get_object_or_404(Order, pk=order_id)
-        order.status = "Preparing"
-        order.save()
+        order_state.transition(order_id, "preparing", expected="confirmed")
         return Response(
             {"message": "Order status updated to Preparing."}, status=status.HTTP_200_OK
         )
     except Order.DoesNotExist:
         return Response({"error": "Order not found."}, status=status.HTTP_404_NOT_FOUND)
+    except order_state.InvalidTransition as e:
+        return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
     except Exception as e:
         return Response(
             {"error": f"Internal Server Error: {str(e)}"},
@@ -1001,7 +1345,13 @@ def update_order_status_to_preparing(request, order_id):
 def assign_order_to_delivery_person(request, order_id):
     order = get_object_or_404(Order, order_id=order_id)
     if order.order_status == "confirmed":
-        success = order.assign_delivery_person()
+        try:
+            success = order.assign_delivery_person()
+        except order_state.InvalidTransition:
+            # Cancelled or assigned by someone else in the meantime
+            return JsonResponse(
+                {"status": "error", "message": "Order is not in confirmed status."}
+            )
         if success:
             return JsonResponse(
                 {
@@ -1022,13 +1372,48 @@ def assign_order_to_delivery_person(request, order_id):
 @permission_classes([IsAuthenticated])
 @api_view(["GET"])
 def order_history_api(request):
-    # Fetch orders for the current user (assuming user is authenticated)
-    orders = Order.objects.filter(user=request.user).order_by("-order_date")
+    try:
+        fields = requested_fields(request, OrderSerializer.Meta.fields)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Fetch orders for the current user (assuming user is authenticated),
+    # selecting only the columns behind the requested fields
+    orders = Order.objects.filter(user=request.user).only(
+        *[name for name in fields if name != "items"],
+        *ordering_columns(ORDER_HISTORY_SORTS),
+    )
+    if "items" in fields:
+        # One query for the items of the whole page, menu item joined in.
+        orders = orders.prefetch_related(
+            Prefetch(
+                "orderitem_set",
+                queryset=OrderItem.objects.select_related("menu_item")
+                .only(
+                    "order",
+                    "menu_item__name",
+                    "menu_item__menu_item_pic",
+                    "quantity",
+                    "price",
+                )
+                .order_by("pk"),
+            )
+        )
+    try:
+        orders, cursor = keyset_page(
+            request,
+            orders,
+            ORDER_HISTORY_SORTS,
+            default_sort="newest",
+            default_limit=settings.ORDER_HISTORY_PAGE_SIZE,
+        )
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
     # Serialize queryset into JSON data
-    serializer = OrderSerializer(orders, many=True)
+    serializer = OrderSerializer(orders, many=True, fields=fields)
 
-    return Response(serializer.data)
+    return paginated_response(request, Response(serializer.data), cursor)
 
 
 @permission_classes([IsAuthenticated])
@@ -1067,6 +1452,13 @@ def add_restaurant_api(request):
             ):
                 return JsonResponse({"error": "All fields are required."}, status=400)
 
+            try:
+                latitude, longitude = parse_coordinates(
+                    data.get("latitude"), data.get("longitude")
+                )
+            except ValueError as e:
+                return JsonResponse({"error": str(e)}, status=400)
+
             # Ensure the restaurant owner's profile exists
             try:
                 owner = RestaurantOwner.objects.get(user=user)
@@ -1084,6 +1476,8 @@ def add_restaurant_api(request):
                 owner=owner,
                 name=name,
                 address=address,
+                latitude=latitude,
+                longitude=longitude,
                 phone_number=phone_number,
                 email=email,
                 description=description,